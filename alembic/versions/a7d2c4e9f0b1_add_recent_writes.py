@@ -0,0 +1,34 @@
+"""add recent_writes
+
+Revision ID: a7d2c4e9f0b1
+Revises: f1c6d8e2a9b3
+Create Date: 2026-10-18 21:07:12.415093
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d2c4e9f0b1'
+down_revision: Union[str, Sequence[str], None] = 'f1c6d8e2a9b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'recent_writes',
+        sa.Column('user_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('until', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('user_id'),
+        prefixes=['UNLOGGED'],
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('recent_writes')
@@ -0,0 +1,36 @@
+"""add sql_profiling
+
+Revision ID: b3e9f2a6c4d8
+Revises: a7d2c4e9f0b1
+Create Date: 2026-10-18 23:41:05.628417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3e9f2a6c4d8'
+down_revision: Union[str, Sequence[str], None] = 'a7d2c4e9f0b1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'sql_profiling',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('enabled', sa.Boolean(), nullable=False),
+        sa.Column('slow_query_ms', sa.Float(), nullable=False),
+        sa.Column('explain_sample_rate', sa.Float(), nullable=False),
+        sa.Column('updated_at', sa.TIMESTAMP(timezone=True), nullable=False, server_default=sa.text('now()')),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('sql_profiling')
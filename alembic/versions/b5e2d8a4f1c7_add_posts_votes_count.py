@@ -0,0 +1,37 @@
+"""add posts votes_count
+
+Revision ID: b5e2d8a4f1c7
+Revises: 7d1f3b6c8e52
+Create Date: 2026-10-18 11:20:13.804126
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e2d8a4f1c7'
+down_revision: Union[str, Sequence[str], None] = '7d1f3b6c8e52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('posts', sa.Column('votes_count', sa.Integer(), nullable=False, server_default=sa.text('0')))
+    op.execute(
+        """
+        UPDATE posts SET votes_count = counted.votes
+        FROM (SELECT post_id, count(*) AS votes FROM votes GROUP BY post_id) AS counted
+        WHERE posts.id = counted.post_id
+        """
+    )
+    op.create_index('ix_posts_votes_count_id', 'posts', ['votes_count', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_posts_votes_count_id', table_name='posts')
+    op.drop_column('posts', 'votes_count')
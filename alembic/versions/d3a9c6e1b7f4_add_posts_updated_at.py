@@ -0,0 +1,29 @@
+"""add posts updated_at
+
+Revision ID: d3a9c6e1b7f4
+Revises: b5e2d8a4f1c7
+Create Date: 2026-10-18 13:41:55.270391
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3a9c6e1b7f4'
+down_revision: Union[str, Sequence[str], None] = 'b5e2d8a4f1c7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('posts', sa.Column('updated_at', sa.TIMESTAMP(timezone=True), nullable=False, server_default=sa.text('now()')))
+    op.execute('UPDATE posts SET updated_at = created_at')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('posts', 'updated_at')
@@ -0,0 +1,45 @@
+"""add post_rankings
+
+Revision ID: e4b7a1c9d2f6
+Revises: d3a9c6e1b7f4
+Create Date: 2026-10-18 14:52:07.481203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b7a1c9d2f6'
+down_revision: Union[str, Sequence[str], None] = 'd3a9c6e1b7f4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'post_rankings',
+        sa.Column('post_id', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.Column('refreshed_at', sa.TIMESTAMP(timezone=True), nullable=False, server_default=sa.text('now()')),
+        sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('post_id'),
+    )
+    op.create_index('ix_post_rankings_score_post_id', 'post_rankings', ['score', 'post_id'], unique=False)
+    # Same formula as app.rankings.hot_score with the default gravity
+    op.execute(
+        """
+        INSERT INTO post_rankings (post_id, score)
+        SELECT id, log(greatest(votes_count, 1)) + extract(epoch FROM created_at) / 45000
+        FROM posts
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_post_rankings_score_post_id', table_name='post_rankings')
+    op.drop_table('post_rankings')
@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import config, models, schemas
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire ttl seconds after being set."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else None,
+        }
+
+
+# ----------------- User Cache -----------------
+# Per worker process. Writes through app/routers/user.py invalidate their
+# entry here; other workers see the change once their entry expires.
+user_cache = TTLCache(maxsize=config.settings.user_cache_size, ttl=config.settings.user_cache_ttl)
+
+
+async def get_user(db: AsyncSession, user_id: int) -> Optional[schemas.UserOut]:
+    user = user_cache.get(user_id)
+    if user is None:
+        row = await db.get(models.User, user_id)
+        if row is None:
+            return None
+        user = schemas.UserOut.model_validate(row)
+        user_cache.set(user_id, user)
+    return user
+
+
+async def get_users(db: AsyncSession, user_ids: Iterable[int]) -> Dict[int, schemas.UserOut]:
+    """Cached users by id; all misses are loaded with a single query."""
+    users, missing = {}, set()
+    for user_id in set(user_ids):
+        user = user_cache.get(user_id)
+        if user is None:
+            missing.add(user_id)
+        else:
+            users[user_id] = user
+
+    if missing:
+        rows = await db.execute(
+            select(models.User.id, models.User.email, models.User.created_at)
+            .where(models.User.id.in_(missing))
+        )
+        for row in rows:
+            user = schemas.UserOut.model_validate(row)
+            user_cache.set(user.id, user)
+            users[user.id] = user
+    return users
@@ -0,0 +1,109 @@
+import argparse
+import sys
+from typing import List, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from app import models, rankings, seed
+from app.database import SessionLocal, engine
+
+
+# ----------------- Vote Counters -----------------
+def find_vote_drift(db: Session):
+    """Rows of (id, votes_count, actual) for posts whose counter disagrees with votes."""
+    counted = (
+        select(models.Vote.post_id, func.count().label("votes"))
+        .group_by(models.Vote.post_id)
+        .subquery()
+    )
+    actual = func.coalesce(counted.c.votes, 0).label("actual")
+    stmt = (
+        select(models.Post.id, models.Post.votes_count, actual)
+        .outerjoin(counted, counted.c.post_id == models.Post.id)
+        .where(models.Post.votes_count != actual)
+        .order_by(models.Post.id)
+    )
+    return db.execute(stmt).all()
+
+
+def reconcile_votes(db: Session, fix: bool = False):
+    drift = find_vote_drift(db)
+    if fix and drift:
+        # Recount under the row lock rather than trusting the numbers read above,
+        # so votes landing in between are not lost
+        recount = (
+            select(func.count())
+            .where(models.Vote.post_id == models.Post.id)
+            .scalar_subquery()
+        )
+        db.execute(
+            update(models.Post)
+            .where(models.Post.id.in_([row.id for row in drift]))
+            .values(votes_count=recount, updated_at=func.clock_timestamp())
+        )
+        db.execute(rankings.refresh_statement([row.id for row in drift]))
+        db.commit()
+    return drift
+
+
+# ----------------- Entry Point -----------------
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    reconcile = commands.add_parser("reconcile-votes", help="check posts.votes_count against the votes table")
+    reconcile.add_argument("--fix", action="store_true", help="rewrite drifting counters")
+
+    commands.add_parser("refresh-rankings", help="rescore every post for /posts/trending")
+
+    defaults = seed.SeedOptions()
+    seeding = commands.add_parser("seed", help="bulk-load reproducible users, posts and votes with COPY")
+    seeding.add_argument("--users", type=int, default=defaults.users)
+    seeding.add_argument("--posts", type=int, default=defaults.posts)
+    seeding.add_argument("--votes", type=int, default=defaults.votes)
+    seeding.add_argument("--zipf", type=float, default=defaults.zipf, help="post popularity skew, > 1")
+    seeding.add_argument("--seed", type=int, default=defaults.seed)
+    seeding.add_argument("--password", default=defaults.password, help="every user's password")
+    seeding.add_argument("--hash-workers", type=int, default=defaults.hash_workers,
+                         help="hash each password across N processes; 0 reuses one hash")
+    seeding.add_argument("--days", type=int, default=defaults.days, help="spread created_at over this many days")
+    seeding.add_argument("--truncate", action="store_true", help="empty users, posts and votes first")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "reconcile-votes":
+        with SessionLocal() as db:
+            drift = reconcile_votes(db, fix=args.fix)
+        for row in drift:
+            print(f"post {row.id}: votes_count={row.votes_count} actual={row.actual}")
+        print(f"{len(drift)} post(s) drifting" + (", fixed" if args.fix and drift else ""))
+        return 1 if drift and not args.fix else 0
+
+    if args.command == "refresh-rankings":
+        with SessionLocal() as db:
+            refreshed = db.execute(rankings.refresh_statement()).rowcount
+            db.commit()
+        print(f"{refreshed} post(s) rescored")
+        return 0
+
+    if args.command == "seed":
+        if args.zipf <= 1:
+            parser.error("--zipf must be greater than 1")
+        options = seed.SeedOptions(
+            users=args.users, posts=args.posts, votes=args.votes, zipf=args.zipf, seed=args.seed,
+            password=args.password, hash_workers=args.hash_workers, days=args.days, truncate=args.truncate,
+        )
+        try:
+            result = seed.seed_database(engine, options)
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            return 1
+        print(f"seeded {result.users} users, {result.posts} posts, {result.votes} votes in {result.seconds:.1f}s")
+        return 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
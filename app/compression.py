@@ -0,0 +1,186 @@
+import zlib
+from typing import Optional
+
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+
+
+# Media types worth compressing; everything else passes through untouched
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+)
+# Clients wait on every event, so these are never compressed
+UNCOMPRESSED_TYPES = ("text/event-stream",)
+
+# Preferred first when the client accepts both equally
+ENCODINGS = ("br", "gzip")
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """The encoding to use for an Accept-Encoding header, or None for identity."""
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+    candidates = [
+        (weights.get(encoding, weights.get("*", 0.0)), -rank, encoding)
+        for rank, encoding in enumerate(ENCODINGS)
+    ]
+    q, _, encoding = max(candidates)
+    return encoding if q > 0 else None
+
+
+class _Gzip:
+    def __init__(self, level: int):
+        # wbits 31: zlib stream with a gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _Brotli:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+def _weaken(headers: MutableHeaders):
+    # The encoded bytes differ from the identity ones, so a strong validator
+    # no longer describes them. If-None-Match compares weakly (see
+    # app.conditional.etag_matches), so revalidation keeps working.
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        headers["ETag"] = f"W/{etag}"
+
+
+class CompressionMiddleware:
+    """Negotiated brotli or gzip for response bodies of at least minimum_size.
+
+    Pure ASGI, like MetricsMiddleware. A body sent in one message is
+    compressed whole; a streamed body (the exports) is compressed chunk by
+    chunk and flushed after each, so nothing is held back, unless
+    streaming=False. Bodies under minimum_size, already encoded responses,
+    ranges and no-transform responses are sent as they are.
+    """
+
+    def __init__(self, app, minimum_size: int, gzip_level: int, brotli_quality: int, streaming: bool = True):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.streaming = streaming
+
+    def _compressor(self, encoding: str):
+        return _Brotli(self.brotli_quality) if encoding == "br" else _Gzip(self.gzip_level)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        encoding = negotiate(request_headers.get("accept-encoding", ""))
+        if encoding is None or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                content_type = headers.get("content-type", "")
+                if message["status"] == 304:
+                    # Whether the 200 would have been compressed depends on
+                    # its size, so echo the form of the validator the client
+                    # holds, which is what its cache will look up
+                    headers.add_vary_header("Accept-Encoding")
+                    etag = headers.get("etag")
+                    if etag and f"W/{etag}" in request_headers.get("if-none-match", ""):
+                        _weaken(headers)
+                    passthrough = True
+                elif (
+                    message["status"] < 200 or message["status"] in (204, 206)
+                    or "content-encoding" in headers
+                    or "no-transform" in headers.get("cache-control", "")
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or content_type.startswith(UNCOMPRESSED_TYPES)
+                ):
+                    passthrough = True
+                else:
+                    headers.add_vary_header("Accept-Encoding")
+                if passthrough:
+                    await send(message)
+                else:
+                    # Held back until the first body message shows its size
+                    start_message = message
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if start_message is not None:
+                headers = MutableHeaders(scope=start_message)
+                if (not more_body and len(body) < self.minimum_size) or (more_body and not self.streaming):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+
+                compressor = self._compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                _weaken(headers)
+                if more_body:
+                    del headers["Content-Length"]
+                    chunk = compressor.compress(body) + compressor.flush()
+                else:
+                    chunk = compressor.compress(body) + compressor.finish()
+                    headers["Content-Length"] = str(len(chunk))
+                await send(start_message)
+                start_message = None
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+                return
+
+            if more_body:
+                chunk = compressor.compress(body) + compressor.flush()
+            else:
+                chunk = compressor.compress(body) + compressor.finish()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,62 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable, Optional
+
+from fastapi import Request, Response, status
+
+
+# Bump when the post response shape changes so cached copies are not reused
+ETAG_VERSION = "1"
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.blake2b(repr((ETAG_VERSION,) + parts).encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+def _etag_opaque(etag: str) -> str:
+    # If-None-Match uses weak comparison, so W/"x" matches "x"
+    etag = etag.strip()
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return _etag_opaque(etag) in {_etag_opaque(candidate) for candidate in header.split(",")}
+
+
+def not_modified_since(request: Request, last_modified: Optional[datetime]) -> bool:
+    # Only consulted when the client sent no If-None-Match (RFC 9110 13.1.3)
+    header = request.headers.get("if-modified-since")
+    if not header or last_modified is None or "if-none-match" in request.headers:
+        return False
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    # HTTP dates have one-second resolution
+    return last_modified.replace(microsecond=0) <= since
+
+
+def is_fresh(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    return etag_matches(request, etag) or not_modified_since(request, last_modified)
+
+
+def cache_headers(etag: str, cache_control: str, last_modified: Optional[datetime] = None) -> dict:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+    return headers
+
+
+def not_modified(headers: dict) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+
+def latest(timestamps: Iterable[datetime]) -> Optional[datetime]:
+    return max(timestamps, default=None)
@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -9,6 +10,78 @@ class Settings(BaseSettings):
     secret_key: str
     algorithm: str
     access_token_expire_minutes: int
+    # asyncpg + AsyncSession when true, psycopg2 on the threadpool otherwise
+    database_async: bool = False
+    # Read replica for GET handlers; port defaults to database_port
+    database_replica_host: Optional[str] = None
+    database_replica_port: Optional[str] = None
+    # How long a user's reads stay on the primary after they write, and where
+    # that is tracked: postgres (shared by all workers) or memory (per worker,
+    # only safe with a single worker)
+    read_your_writes_seconds: float = 5
+    read_your_writes_backend: str = "postgres"
+    # Connection pool, per engine and worker. Keep pool size + overflow close
+    # to threadpool_limit so sync handlers do not queue on the pool.
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    db_pool_pre_ping: bool = True
+    db_pool_recycle: int = 1800
+    # 0 disables the server-side statement timeout
+    db_statement_timeout_ms: int = 0
+    threadpool_limit: int = 40
+    # Startup warm-up: connections opened per engine (capped at db_pool_size),
+    # hot queries compiled, hashing processes started and schemas built
+    warmup: bool = True
+    warmup_connections: int = 2
+    # Password hashing: bcrypt cost, process pool size and the number of
+    # hash/verify jobs a worker accepts before answering 503
+    bcrypt_rounds: int = 12
+    hash_workers: int = 2
+    hash_queue_limit: int = 32
+    # /login token buckets per client IP and per username. Backend: memory
+    # (per worker), postgres (shared by all workers) or none
+    login_throttle_backend: str = "memory"
+    login_ip_burst: int = 20
+    login_ip_per_minute: float = 10
+    login_user_burst: int = 5
+    login_user_per_minute: float = 2
+    login_throttle_max_keys: int = 100000
+    # Per-worker LRU of users for auth and post owners; ttl in seconds
+    user_cache_size: int = 10000
+    user_cache_ttl: float = 60
+    # Response compression: brotli or gzip, whichever the client prefers, for
+    # bodies of at least compression_minimum_size bytes; streamed bodies
+    # (exports) are compressed chunk by chunk unless compress_streams is off
+    compression_enabled: bool = True
+    compression_minimum_size: int = 1024
+    gzip_level: int = 6
+    brotli_quality: int = 4
+    compress_streams: bool = True
+    # Cache-Control max-age for GET /posts/{id}; 0 makes clients revalidate
+    post_cache_max_age: int = 0
+    # Request/pool/hashing metrics and GET /metrics
+    metrics_enabled: bool = True
+    # SQL profiling (Server-Timing, slow-query log, sampled EXPLAIN); the
+    # starting values, PUT /stats/profiling changes them for every worker,
+    # which pick changes up within profiling_refresh_seconds
+    sql_profiling: bool = False
+    slow_query_ms: float = 100
+    explain_sample_rate: float = 0
+    profiling_refresh_seconds: float = 5
+    # Operator credential (X-Admin-Token header) for PUT /stats/profiling;
+    # unset, runtime changes are refused
+    admin_token: Optional[str] = None
+    # Largest list POST /vote/batch accepts
+    vote_batch_limit: int = 500
+    # Largest list POST /posts/bulk accepts
+    post_bulk_limit: int = 1000
+    # Rows per server-side cursor fetch for GET /posts/export
+    export_batch_size: int = 1000
+    # Trending: each 10x in votes is worth this much recency, and how often
+    # each worker rescores the posts it saw votes for (0 disables the loop)
+    trending_gravity_seconds: int = 45000
+    rankings_refresh_seconds: float = 10
 
     class Config:
         env_file = ".env"
@@ -1,6 +1,24 @@
-from sqlalchemy import create_engine
+import json
+import logging
+import random
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+from fastapi import Depends
+from fastapi.security import OAuth2PasswordBearer
+from jose import JWTError, jwt
+from sqlalchemy import (
+    TIMESTAMP, Boolean, Column, Float, Integer, Table, bindparam, create_engine, delete, event, exc, func, lambda_stmt,
+    select, text,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.interfaces import CacheStats
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.concurrency import run_in_threadpool
 from . import config
 
 SQLALCHEMY_DATABASE_URL = (
@@ -8,13 +26,631 @@ SQLALCHEMY_DATABASE_URL = (
     f"@{config.settings.database_host}:{config.settings.database_port}/{config.settings.database_name}"
 )
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# Optional streaming replica with the same credentials and database name
+if config.settings.database_replica_host:
+    SQLALCHEMY_REPLICA_URL = (
+        f"postgresql://{config.settings.database_username}:{config.settings.database_password}"
+        f"@{config.settings.database_replica_host}:{config.settings.database_replica_port or config.settings.database_port}"
+        f"/{config.settings.database_name}"
+    )
+else:
+    SQLALCHEMY_REPLICA_URL = None
+
+
+# ----------------- Pool Metrics -----------------
+class PoolMetrics:
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def observe(self, seconds: float):
+        self.checkouts += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+
+
+class _MeteredPoolMixin:
+    """Times every checkout, including waiting for a free connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        finally:
+            self.metrics.observe(time.perf_counter() - start)
+
+    def recreate(self):
+        # dispose() swaps in a fresh pool; keep counting into the same metrics
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+class MeteredQueuePool(_MeteredPoolMixin, QueuePool):
+    pass
+
+
+class MeteredAsyncAdaptedQueuePool(_MeteredPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _pool_options() -> dict:
+    return {
+        "pool_size": config.settings.db_pool_size,
+        "max_overflow": config.settings.db_max_overflow,
+        "pool_timeout": config.settings.db_pool_timeout,
+        "pool_pre_ping": config.settings.db_pool_pre_ping,
+        "pool_recycle": config.settings.db_pool_recycle,
+    }
+
+
+def _connect_args(is_async: bool) -> dict:
+    timeout = config.settings.db_statement_timeout_ms
+    if not timeout:
+        return {}
+    if is_async:
+        return {"server_settings": {"statement_timeout": str(timeout)}}
+    return {"options": f"-c statement_timeout={timeout}"}
+
+
+def _create_sync_engine(url: str):
+    return create_engine(
+        url,
+        poolclass=MeteredQueuePool,
+        connect_args=_connect_args(is_async=False),
+        **_pool_options(),
+    )
+
+
+def _create_async_engine(url: str):
+    return create_async_engine(
+        url.replace("postgresql://", "postgresql+asyncpg://", 1),
+        poolclass=MeteredAsyncAdaptedQueuePool,
+        connect_args=_connect_args(is_async=True),
+        **_pool_options(),
+    )
+
+
+# The sync engine always exists: alembic, the CLI and the tests use it, and it
+# serves requests too unless DATABASE_ASYNC is set.
+engine = _create_sync_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
+# Replica engines are only built for the mode in use
+replica_engine = None
+ReplicaSessionLocal = None
+async_engine = None
+AsyncSessionLocal = None
+async_replica_engine = None
+AsyncReplicaSessionLocal = None
+
+if config.settings.database_async:
+    async_engine = _create_async_engine(SQLALCHEMY_DATABASE_URL)
+    # Nothing may lazy-load after commit on an AsyncSession
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    if SQLALCHEMY_REPLICA_URL:
+        async_replica_engine = _create_async_engine(SQLALCHEMY_REPLICA_URL)
+        AsyncReplicaSessionLocal = async_sessionmaker(async_replica_engine, autoflush=False, expire_on_commit=False)
+elif SQLALCHEMY_REPLICA_URL:
+    replica_engine = _create_sync_engine(SQLALCHEMY_REPLICA_URL)
+    ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+
+
+def pool_stats() -> dict:
+    engines = {"sync": engine}
+    if replica_engine is not None:
+        engines["sync_replica"] = replica_engine
+    if async_engine is not None:
+        engines["async"] = async_engine.sync_engine
+    if async_replica_engine is not None:
+        engines["async_replica"] = async_replica_engine.sync_engine
+
+    stats = {}
+    for name, current in engines.items():
+        pool = current.pool
+        metrics = pool.metrics
+        stats[name] = {
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            # QueuePool counts overflow from -pool_size while the pool fills up
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": config.settings.db_max_overflow,
+            "checkouts": metrics.checkouts,
+            "timeouts": metrics.timeouts,
+            "wait_avg_ms": metrics.wait_total / metrics.checkouts * 1000 if metrics.checkouts else 0.0,
+            "wait_max_ms": metrics.wait_max * 1000,
+        }
+    return stats
+
+
+async def dispose_engines():
+    """Close every pooled connection, e.g. at shutdown."""
+    for current in (async_engine, async_replica_engine):
+        if current is not None:
+            await current.dispose()
+    for current in (engine, replica_engine):
+        if current is not None:
+            await run_in_threadpool(current.dispose)
+
+
+# ----------------- Threaded Session -----------------
+class ThreadedSession:
+    """The subset of the AsyncSession API the routers use, over a sync Session.
+
+    Each awaited call runs on the threadpool, so with DATABASE_ASYNC off the
+    async routers still run on psycopg2 without blocking the event loop.
+    """
+
+    def __init__(self, sync_session: Session):
+        self.sync_session = sync_session
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    async def execute(self, statement, params=None, **kwargs):
+        return await run_in_threadpool(self.sync_session.execute, statement, params, **kwargs)
+
+    async def stream(self, statement, params=None, **kwargs):
+        # psycopg2 only uses a server-side cursor when yield_per is set
+        result = await run_in_threadpool(self.sync_session.execute, statement, params, **kwargs)
+        return ThreadedResult(result)
+
+    async def scalar(self, statement, params=None, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalar, statement, params, **kwargs)
+
+    async def scalars(self, statement, params=None, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalars, statement, params, **kwargs)
+
+    async def get(self, entity, ident, **kwargs):
+        return await run_in_threadpool(self.sync_session.get, entity, ident, **kwargs)
+
+    async def refresh(self, instance, attribute_names=None):
+        await run_in_threadpool(self.sync_session.refresh, instance, attribute_names)
+
+    async def delete(self, instance):
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def flush(self):
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def commit(self):
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def close(self):
+        await run_in_threadpool(self.sync_session.close)
+
+
+class ThreadedResult:
+    """AsyncResult.partitions() over a buffered or server-side sync Result."""
+
+    def __init__(self, result):
+        self.result = result
+
+    async def partitions(self, size: Optional[int] = None):
+        partitions = self.result.partitions(size)
+        while True:
+            partition = await run_in_threadpool(next, partitions, None)
+            if partition is None:
+                return
+            yield partition
+
+
+# ----------------- DB Dependencies -----------------
+def open_session(replica: bool = False):
+    if AsyncSessionLocal is not None:
+        factory = AsyncReplicaSessionLocal if replica and AsyncReplicaSessionLocal else AsyncSessionLocal
+        return factory()
+    factory = ReplicaSessionLocal if replica and ReplicaSessionLocal else SessionLocal
+    return ThreadedSession(factory())
+
+
+async def get_db():
+    db = open_session()
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
+
+
+# ----------------- Read Routing -----------------
+# After a user writes, their reads stay on the primary for
+# READ_YOUR_WRITES_SECONDS, so they never see the replica before it has
+# caught up. The next request may land on any worker, so by default the
+# window is kept on the primary itself.
+
+# A Core table rather than a model: app.models imports this module
+recent_writes = Table(
+    "recent_writes",
+    Base.metadata,
+    Column("user_id", Integer, primary_key=True, autoincrement=False),
+    Column("until", TIMESTAMP(timezone=True), nullable=False),
+    prefixes=["UNLOGGED"],
+)
+
+_write_user_id = bindparam("user_id", type_=Integer)
+_window_seconds = bindparam("seconds", type_=Float)
+
+
+def _window_end():
+    # The primary's clock, so every worker agrees on when a window ends
+    return func.clock_timestamp() + func.make_interval(0, 0, 0, 0, 0, 0, _window_seconds)
+
+
+_record_write = lambda_stmt(lambda: (
+    insert(recent_writes)
+    .values(user_id=_write_user_id, until=_window_end())
+    .on_conflict_do_update(index_elements=[recent_writes.c.user_id], set_={"until": _window_end()})
+))
+_wrote_recently = lambda_stmt(lambda: (
+    select(recent_writes.c.user_id)
+    .where(recent_writes.c.user_id == _write_user_id, recent_writes.c.until > func.clock_timestamp())
+))
+
+
+class MemoryWriteLog:
+    """Windows in this worker only: right for a single worker, not for gunicorn."""
+
+    def __init__(self):
+        # user id -> monotonic deadline
+        self._deadlines: Dict[int, float] = {}
+
+    async def record(self, db, user_id: int):
+        now = time.monotonic()
+        if len(self._deadlines) > 10000:
+            for stale in [uid for uid, deadline in self._deadlines.items() if deadline < now]:
+                del self._deadlines[stale]
+        self._deadlines[user_id] = now + config.settings.read_your_writes_seconds
+
+    async def wrote_recently(self, user_id: int) -> bool:
+        deadline = self._deadlines.get(user_id)
+        return deadline is not None and deadline >= time.monotonic()
+
+    def clear(self):
+        self._deadlines.clear()
+
+
+class PostgresWriteLog:
+    """Windows in the recent_writes table on the primary, seen by every worker.
+
+    The window is written in the caller's transaction, so it commits with
+    the write it covers. Checking it costs one primary-key lookup on the
+    primary per authenticated read.
+    """
+
+    # Expired windows are deleted at most this often per worker
+    PRUNE_SECONDS = 60
+
+    def __init__(self):
+        self.next_prune = 0.0
+
+    async def record(self, db, user_id: int):
+        await db.execute(_record_write, {"user_id": user_id, "seconds": config.settings.read_your_writes_seconds})
+        now = time.monotonic()
+        if now >= self.next_prune:
+            self.next_prune = now + self.PRUNE_SECONDS
+            await db.execute(delete(recent_writes).where(recent_writes.c.until < func.clock_timestamp()))
+
+    async def wrote_recently(self, user_id: int) -> bool:
+        db = open_session()
+        try:
+            return await db.scalar(_wrote_recently, {"user_id": user_id}) is not None
+        finally:
+            await db.close()
+
+    def clear(self):
+        pass
+
+
+def _make_write_log(name: str):
+    if name == "memory":
+        return MemoryWriteLog()
+    if name == "postgres":
+        return PostgresWriteLog()
+    raise ValueError(f"unknown read_your_writes_backend {name!r}, expected memory or postgres")
+
+
+write_log = _make_write_log(config.settings.read_your_writes_backend)
+
+_optional_token = OAuth2PasswordBearer(tokenUrl="login", auto_error=False)
+
+
+def _has_replica() -> bool:
+    return ReplicaSessionLocal is not None or AsyncReplicaSessionLocal is not None
+
+
+async def record_write(db, user_id: int):
+    """Send this user's reads to the primary until replication has caught up.
+
+    Call before committing the write on db.
+    """
+    if _has_replica():
+        await write_log.record(db, user_id)
+
+
+async def wrote_recently(user_id: Optional[int]) -> bool:
+    if user_id is None or not _has_replica():
+        return False
+    return await write_log.wrote_recently(user_id)
+
+
+def _token_user_id(token: Optional[str]) -> Optional[int]:
+    # Only picks the engine; oauth2.get_current_user still does the real check
+    if not token:
+        return None
+    try:
+        payload = jwt.decode(token, config.settings.secret_key, algorithms=[config.settings.algorithm])
+    except JWTError:
+        return None
+    return payload.get("user_id")
+
+
+async def get_read_db(token: Optional[str] = Depends(_optional_token)):
+    """Session for GET handlers: the replica, unless the caller wrote recently."""
+    db = open_session(replica=not await wrote_recently(_token_user_id(token)))
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+# ----------------- Query Counter -----------------
+class QueryCounter:
+    """Counts (and keeps) statements sent to the database while the block is active.
+
+    Listens on the Engine class, so it also sees engines created by tests
+    and the sync engine underneath an AsyncEngine.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+        # Statements compiled for this execution instead of coming from the
+        # compiled cache: first runs, and constructs with no cache key
+        self.compiled = []
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        self.statements.append(statement)
+        if context.cache_hit is not CacheStats.CACHE_HIT:
+            self.compiled.append(statement)
+
+    @property
+    def cache_hit_ratio(self) -> Optional[float]:
+        return 1 - len(self.compiled) / self.count if self.count else None
+
+    def __enter__(self):
+        event.listen(Engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(Engine, "before_cursor_execute", self._on_execute)
+
+
+# ----------------- SQL Profiling -----------------
+slow_query_log = logging.getLogger("app.slow_queries")
+
+
+# One row (id 1) with the switches PUT /stats/profiling last set; without it
+# the settings apply. Shared, so every worker profiles or none does.
+sql_profiling = Table(
+    "sql_profiling",
+    Base.metadata,
+    Column("id", Integer, primary_key=True, autoincrement=False),
+    Column("enabled", Boolean, nullable=False),
+    Column("slow_query_ms", Float, nullable=False),
+    Column("explain_sample_rate", Float, nullable=False),
+    Column("updated_at", TIMESTAMP(timezone=True), nullable=False, server_default=text("now()")),
+)
+
+_profiling_enabled = bindparam("enabled", type_=Boolean)
+_profiling_slow_query_ms = bindparam("slow_query_ms", type_=Float)
+_profiling_sample_rate = bindparam("explain_sample_rate", type_=Float)
+
+_profiling_row = select(
+    sql_profiling.c.enabled, sql_profiling.c.slow_query_ms, sql_profiling.c.explain_sample_rate
+).where(sql_profiling.c.id == 1)
+_save_profiling = lambda_stmt(lambda: (
+    insert(sql_profiling)
+    .values(
+        id=1,
+        enabled=_profiling_enabled,
+        slow_query_ms=_profiling_slow_query_ms,
+        explain_sample_rate=_profiling_sample_rate,
+        updated_at=func.now(),
+    )
+    .on_conflict_do_update(
+        index_elements=[sql_profiling.c.id],
+        set_={
+            "enabled": _profiling_enabled,
+            "slow_query_ms": _profiling_slow_query_ms,
+            "explain_sample_rate": _profiling_sample_rate,
+            "updated_at": func.now(),
+        },
+    )
+))
+
+
+class ProfilingOptions:
+    """Switches for SQL profiling, as this worker last read them.
+
+    The statement listeners read these attributes on every execution, so
+    they are a local copy: ProfilingMiddleware re-reads the sql_profiling
+    row at most every PROFILING_REFRESH_SECONDS.
+    """
+
+    def __init__(self):
+        self._reset()
+        # Monotonic time after which the next request re-reads the row
+        self.next_refresh = 0.0
+
+    def _reset(self):
+        self.enabled = config.settings.sql_profiling
+        self.slow_query_ms = config.settings.slow_query_ms
+        # Share of slow SELECTs re-run under EXPLAIN (ANALYZE, BUFFERS)
+        self.explain_sample_rate = config.settings.explain_sample_rate
+
+    async def refresh(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now < self.next_refresh:
+            return
+        # Moved on first, so concurrent requests do not all read the row
+        self.next_refresh = now + config.settings.profiling_refresh_seconds
+        db = open_session()
+        try:
+            row = (await db.execute(_profiling_row)).first()
+        except Exception:
+            slow_query_log.exception("Reading the profiling switches failed")
+            return
+        finally:
+            await db.close()
+        if row is None:
+            self._reset()
+        else:
+            self.enabled, self.slow_query_ms, self.explain_sample_rate = row
+
+    async def update(self, **changes) -> dict:
+        """Change the switches for every worker; the others follow within the refresh interval."""
+        await self.refresh(force=True)
+        values = {**self.as_dict(), **changes}
+        db = open_session()
+        try:
+            await db.execute(_save_profiling, values)
+            await db.commit()
+        finally:
+            await db.close()
+        self.enabled, self.slow_query_ms, self.explain_sample_rate = (
+            values["enabled"], values["slow_query_ms"], values["explain_sample_rate"]
+        )
+        return self.as_dict()
+
+    def as_dict(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "slow_query_ms": self.slow_query_ms,
+            "explain_sample_rate": self.explain_sample_rate,
+        }
+
+
+profiling = ProfilingOptions()
+
+
+class RequestProfile:
+    """Statements run on behalf of one request (see app/profiling.py)."""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.count = 0
+        self.total = 0.0
+        self.slowest = 0.0
+        self.slowest_statement: Optional[str] = None
+        self.slowest_plan: Optional[str] = None
+
+    def record(self, statement: str, elapsed: float, plan: Optional[str]):
+        self.count += 1
+        self.total += elapsed
+        if elapsed >= self.slowest:
+            self.slowest = elapsed
+            self.slowest_statement = statement
+            self.slowest_plan = plan
+
+    def server_timing(self) -> str:
+        return (
+            f'db;dur={self.total * 1000:.2f};desc="{self.count} queries", '
+            f"db-slowest;dur={self.slowest * 1000:.2f}"
+        )
+
+    def log_entry(self) -> dict:
+        return {
+            "request": self.label,
+            "queries": self.count,
+            "db_ms": round(self.total * 1000, 2),
+            "slowest_ms": round(self.slowest * 1000, 2),
+            "statement": self.slowest_statement,
+            "plan": self.slowest_plan,
+        }
+
+
+# Set by the profiling middleware; threadpool calls run in a copy of the
+# request's context, so ThreadedSession statements are attributed too
+current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("current_profile", default=None)
+
+
+def _explain(conn, statement: str, parameters) -> Optional[str]:
+    # A raw cursor on the same connection, so the plan sees the request's
+    # transaction; the savepoint keeps a failed EXPLAIN from aborting it
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute("SAVEPOINT sql_profile_explain")
+        try:
+            cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters)
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+        except Exception:
+            cursor.execute("ROLLBACK TO SAVEPOINT sql_profile_explain")
+            slow_query_log.exception("EXPLAIN failed")
+            return None
+        cursor.execute("RELEASE SAVEPOINT sql_profile_explain")
+        return plan
+    finally:
+        cursor.close()
+
+
+def _should_explain(statement: str, context, executemany: bool) -> bool:
+    # ANALYZE really runs the statement, so only plain SELECTs qualify, and
+    # not while a server-side cursor is still streaming on the connection
+    if executemany or profiling.explain_sample_rate <= 0:
+        return False
+    if not statement.lstrip()[:6].upper() == "SELECT":
+        return False
+    if context is not None and context.execution_options.get("stream_results"):
+        return False
+    return random.random() < profiling.explain_sample_rate
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _profile_before(conn, cursor, statement, parameters, context, executemany):
+    if profiling.enabled and context is not None:
+        context._profile_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _profile_after(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_profile_start", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    plan = None
+    slow = elapsed * 1000 >= profiling.slow_query_ms
+    if slow and _should_explain(statement, context, executemany):
+        plan = _explain(conn, statement, parameters)
+
+    profile = current_profile.get()
+    if profile is not None:
+        profile.record(statement, elapsed, plan)
+    elif slow:
+        # Outside a request (CLI, background loops) each slow statement is
+        # logged on its own
+        slow_query_log.warning(json.dumps({
+            "request": None,
+            "queries": 1,
+            "db_ms": round(elapsed * 1000, 2),
+            "slowest_ms": round(elapsed * 1000, 2),
+            "statement": statement,
+            "plan": plan,
+        }))
@@ -0,0 +1,61 @@
+import csv
+import io
+from typing import AsyncIterator
+
+import orjson
+
+from app import config, database, models
+
+
+EXPORT_COLUMNS = (
+    models.Post.id,
+    models.Post.title,
+    models.Post.content,
+    models.Post.published,
+    models.Post.created_at,
+    models.Post.updated_at,
+    models.Post.owner_id,
+    models.Post.votes_count.label("votes"),
+)
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def _ndjson(rows) -> bytes:
+    return b"".join(orjson.dumps(row._asdict(), option=orjson.OPT_UTC_Z) + b"\n" for row in rows)
+
+
+def _csv(rows) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(
+        [value.isoformat() if hasattr(value, "isoformat") else value for value in row] for row in rows
+    )
+    return buffer.getvalue().encode()
+
+
+def _csv_header() -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow([column.key for column in EXPORT_COLUMNS])
+    return buffer.getvalue().encode()
+
+
+async def stream_rows(query, format: str, replica: bool = False) -> AsyncIterator[bytes]:
+    """Encoded chunks of query's rows, one chunk per server-side cursor fetch.
+
+    Only one batch is held at a time, so memory stays flat however many rows
+    the export has.
+    """
+    encode = _ndjson if format == "ndjson" else _csv
+    if format == "csv":
+        yield _csv_header()
+
+    db = database.open_session(replica=replica)
+    try:
+        result = await db.stream(query.execution_options(yield_per=config.settings.export_batch_size))
+        async for rows in result.partitions():
+            yield encode(rows)
+    finally:
+        await db.close()
@@ -1,7 +1,11 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager, suppress
+from anyio import to_thread
 from fastapi import FastAPI
-from app import models
-from app.database import engine
-from app.routers import post, user, auth, vote
+from app import models, utils, config, rankings, metrics, profiling, warmup, compression
+from app.database import dispose_engines
+from app.routers import post, user, auth, vote, stats
 from .config import Settings
 from fastapi.middleware.cors import CORSMiddleware
    
@@ -11,21 +15,74 @@ class Config:
 # Create tables
 # models.Base.metadata.create_all(bind=engine)
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
-app.include_router(post.router)
-app.include_router(user.router)
-app.include_router(auth.router)
-app.include_router(vote.router)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Sync dependencies and ThreadedSession calls run on this limiter
+    to_thread.current_default_thread_limiter().total_tokens = config.settings.threadpool_limit
+    app.state.warmup_ms = {}
+    if config.settings.warmup:
+        app.state.warmup_ms = await warmup.warm_up(app)
+        logger.info("warm-up took %s ms", app.state.warmup_ms)
+    refresher = None
+    if config.settings.rankings_refresh_seconds > 0:
+        refresher = asyncio.create_task(rankings.refresh_loop(config.settings.rankings_refresh_seconds))
+    yield
+    if refresher is not None:
+        refresher.cancel()
+        with suppress(asyncio.CancelledError):
+            await refresher
+        # Posts marked since the last tick would otherwise wait for another
+        # vote before reaching /posts/trending
+        await rankings.refresh_once()
+    utils.shutdown_pool()
+    await dispose_engines()
 
-@app.get("/")
-def root():
-    return {"message": "Welcome to FastAPI!!!S 🚀"}
+
+def create_app() -> FastAPI:
+    app = FastAPI(lifespan=lifespan)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # Inside the metrics and profiling middleware, so they see what is
+    # actually sent
+    if config.settings.compression_enabled:
+        app.add_middleware(
+            compression.CompressionMiddleware,
+            minimum_size=config.settings.compression_minimum_size,
+            gzip_level=config.settings.gzip_level,
+            brotli_quality=config.settings.brotli_quality,
+            streaming=config.settings.compress_streams,
+        )
+
+    # Only does work while profiling is switched on
+    app.add_middleware(profiling.ProfilingMiddleware)
+
+    if config.settings.metrics_enabled:
+        app.add_middleware(metrics.MetricsMiddleware)
+        app.add_route("/metrics", metrics.metrics_endpoint, include_in_schema=False)
+
+    app.include_router(post.router)
+    app.include_router(user.router)
+    app.include_router(auth.router)
+    app.include_router(vote.router)
+    app.include_router(stats.router)
+
+    @app.get("/")
+    def root():
+        return {"message": "Welcome to FastAPI!!!S 🚀"}
+
+    return app
+
+
+# uvicorn/gunicorn load app.main:app; use --factory app.main:create_app for a
+# fresh instance
+app = create_app()
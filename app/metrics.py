@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+
+from fastapi import Request, Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+
+# ----------------- Metrics -----------------
+# Under gunicorn, set PROMETHEUS_MULTIPROC_DIR (see gunicorn.conf.py): every
+# worker then writes its samples there and /metrics sums them, whichever
+# worker serves the scrape.
+REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route template and status",
+    ["method", "route", "status"],
+)
+LATENCY = Histogram(
+    "http_request_duration_seconds", "Time until the last response byte was sent",
+    ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes", "Response body size",
+    ["method", "route"],
+    buckets=(100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000),
+)
+IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "Requests being served",
+    ["method"], multiprocess_mode="livesum",
+)
+HASH_SECONDS = Histogram(
+    "password_hash_seconds", "bcrypt work including the wait for a pool process",
+    ["operation"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+LOGIN_THROTTLED = Counter(
+    "login_throttled_total", "Login attempts refused by the token buckets",
+    ["limit"],
+)
+
+POOL_CONNECTIONS = Gauge(
+    "db_pool_connections", "Pooled connections by state",
+    ["engine", "state"], multiprocess_mode="livesum",
+)
+POOL_CHECKOUTS = Counter("db_pool_checkouts_total", "Connection checkouts", ["engine"])
+POOL_TIMEOUTS = Counter("db_pool_timeouts_total", "Checkouts that timed out", ["engine"])
+POOL_WAIT = Counter("db_pool_wait_seconds_total", "Time spent waiting for a connection", ["engine"])
+
+# Requests that matched no route, or used an unusual method, share one label
+# so scanners cannot blow up the number of series
+UNMATCHED_ROUTE = "unmatched"
+METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+# Pool numbers are copied into the metrics at most this often per worker
+POOL_SYNC_SECONDS = 1.0
+
+
+def observe_hash(operation: str, seconds: float):
+    HASH_SECONDS.labels(operation).observe(seconds)
+
+
+class _PoolSync:
+    """Turns database.pool_stats() snapshots into gauges and counter increments."""
+
+    def __init__(self):
+        self.next_sync = 0.0
+        self.seen = {}
+        self.lock = threading.Lock()
+
+    def maybe_sync(self):
+        # Imported here: app.utils pulls this module into the hashing
+        # processes, which have no use for database engines
+        from app import database
+
+        now = time.monotonic()
+        if now < self.next_sync or not self.lock.acquire(blocking=False):
+            return
+        try:
+            self.next_sync = now + POOL_SYNC_SECONDS
+            for name, stats in database.pool_stats().items():
+                POOL_CONNECTIONS.labels(name, "checked_out").set(stats["checked_out"])
+                POOL_CONNECTIONS.labels(name, "checked_in").set(stats["checked_in"])
+                POOL_CONNECTIONS.labels(name, "overflow").set(stats["overflow"])
+                wait_total = stats["wait_avg_ms"] * stats["checkouts"] / 1000
+                last = self.seen.get(name, (0, 0, 0.0))
+                POOL_CHECKOUTS.labels(name).inc(max(stats["checkouts"] - last[0], 0))
+                POOL_TIMEOUTS.labels(name).inc(max(stats["timeouts"] - last[1], 0))
+                POOL_WAIT.labels(name).inc(max(wait_total - last[2], 0))
+                self.seen[name] = (stats["checkouts"], stats["timeouts"], wait_total)
+        finally:
+            self.lock.release()
+
+
+pool_sync = _PoolSync()
+
+
+# ----------------- Middleware -----------------
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streamed bodies pass through untouched."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"] if scope["method"] in METHODS else "OTHER"
+        status_code = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        in_progress = IN_PROGRESS.labels(method)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            in_progress.dec()
+            # The router leaves the matched route in the scope
+            route = scope.get("route")
+            route = route.path if route is not None else UNMATCHED_ROUTE
+            REQUESTS.labels(method, route, str(status_code)).inc()
+            LATENCY.labels(method, route).observe(elapsed)
+            RESPONSE_SIZE.labels(method, route).observe(size)
+            pool_sync.maybe_sync()
+
+
+# ----------------- Endpoint -----------------
+def metrics_endpoint(request: Request) -> Response:
+    pool_sync.maybe_sync()
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Boolean, text, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Boolean, Float, text, ForeignKey, Index, Computed
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.sql.sqltypes import TIMESTAMP
 from .database import Base
 
@@ -12,9 +13,31 @@ class Post(Base):
     published = Column(Boolean, default=True)
     rating = Column(Integer, nullable=True)
     created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+    # Bumped with clock_timestamp() by every edit and vote; versions ETags
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
     owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    # Kept in step with the votes table by the vote and user routers;
+    # `python -m app.cli reconcile-votes` repairs any drift
+    votes_count = Column(Integer, nullable=False, server_default=text('0'))
+    # Maintained by Postgres; only read by ?mode=fts searches, so never loaded by default
+    search_vector = deferred(Column(
+        TSVECTOR,
+        Computed("to_tsvector('english', title || ' ' || content)", persisted=True),
+    ))
+
+    owner = relationship("User")
+
+    # The pg_trgm index on title for substring search lives in the alembic
+    # migration only, since create_all() cannot enable the extension.
+    __table_args__ = (
+        # Backs keyset pagination on GET /posts
+        Index("ix_posts_created_at_id", "created_at", "id"),
+        # Backs ?sort=votes
+        Index("ix_posts_votes_count_id", "votes_count", "id"),
+        Index("ix_posts_search_vector", "search_vector", postgresql_using="gin"),
+    )
+
 
-owner= relationship("User") 
 class User(Base):
     __tablename__="users"
     id = Column(Integer, primary_key=True, index=True)
@@ -26,3 +49,26 @@ class Vote(Base):
     __tablename__ = "votes"
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
     post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True)    
+
+
+# Precomputed trending scores, maintained by app/rankings.py
+class PostRanking(Base):
+    __tablename__ = "post_rankings"
+    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True)
+    score = Column(Float, nullable=False)
+    refreshed_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+
+    __table_args__ = (
+        Index("ix_post_rankings_score_post_id", "score", "post_id"),
+    )
+
+
+# Login token buckets, used when login_throttle_backend is postgres. Losing
+# them on a crash only resets the limits, so the table skips the WAL.
+class LoginThrottle(Base):
+    __tablename__ = "login_throttle"
+    key = Column(String, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
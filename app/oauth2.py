@@ -1,16 +1,18 @@
+import secrets
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
-from typing import Union
+from typing import Optional, Union
 
 from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from fastapi.security import APIKeyHeader, OAuth2PasswordBearer
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app import schemas, database, models
+from app import schemas, database, cache
 from . import config
 
 # Dependency to extract token from request headers
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
+admin_token_scheme = APIKeyHeader(name="X-Admin-Token", auto_error=False)
 
 # Config from .env
 SECRET_KEY = config.settings.secret_key
@@ -40,10 +42,10 @@ def verify_access_token(token: str, credentials_exception: HTTPException) -> sch
 
 
 # FastAPI dependency to get current user from token
-def get_current_user(
+async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(database.get_db)
-) -> models.User:
+    db: AsyncSession = Depends(database.get_db)
+) -> schemas.UserOut:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -51,5 +53,20 @@ def get_current_user(
     )
 
     token_data = verify_access_token(token, credentials_exception)
-    user = db.query(models.User).filter(models.User.id == token_data.id).first()
+    user = await cache.get_user(db, token_data.id)
+    if user is None:
+        raise credentials_exception
     return user
+
+
+# FastAPI dependency for operator-only endpoints. Any visitor can sign up, so
+# a user's bearer token is not enough; with no ADMIN_TOKEN set they are off.
+def require_admin(token: Optional[str] = Depends(admin_token_scheme)):
+    expected = config.settings.admin_token
+    if not expected:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Runtime changes are disabled; set ADMIN_TOKEN to enable them",
+        )
+    if not token or not secrets.compare_digest(token.encode(), expected.encode()):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid admin token")
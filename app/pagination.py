@@ -0,0 +1,26 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, Tuple
+
+from fastapi import HTTPException, status
+
+
+# Cursors are opaque to clients: urlsafe base64 of the sort name and the
+# last row's sort key, so a cursor cannot be replayed against another sort.
+def encode_cursor(sort: str, key: Any, id: int) -> str:
+    if isinstance(key, datetime):
+        key = key.isoformat()
+    raw = json.dumps([sort, key, id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, parse_key: Callable[[Any], Any]) -> Tuple[Any, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, key, id = json.loads(raw)
+        if cursor_sort != sort:
+            raise ValueError(cursor_sort)
+        return parse_key(key), int(id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
@@ -0,0 +1,44 @@
+import json
+import time
+
+from starlette.datastructures import MutableHeaders
+
+from app import database
+
+
+class ProfilingMiddleware:
+    """Collects a RequestProfile per request while SQL profiling is on.
+
+    Adds a Server-Timing header (query count, DB time, slowest statement, time
+    to first byte) and logs the request to app.slow_queries when its slowest
+    statement crossed the threshold. Statements run while streaming a body
+    come after the header, so they only show up in the log.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            await database.profiling.refresh()
+        if scope["type"] != "http" or not database.profiling.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        profile = database.RequestProfile(f'{scope["method"]} {scope["path"]}')
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                elapsed = (time.perf_counter() - start) * 1000
+                headers.append("Server-Timing", f"{profile.server_timing()}, app;dur={elapsed:.2f}")
+            await send(message)
+
+        token = database.current_profile.set(profile)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            database.current_profile.reset(token)
+            if profile.count and profile.slowest * 1000 >= database.profiling.slow_query_ms:
+                database.slow_query_log.warning(json.dumps(profile.log_entry()))
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+from typing import Iterable, Optional, Set
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from app import config, database, models
+
+logger = logging.getLogger(__name__)
+
+# Posts whose votes changed since the last refresh. Per worker, like the user
+# cache: each worker rescores the posts it saw votes for.
+_dirty: Set[int] = set()
+
+
+def mark_dirty(post_ids: Iterable[int]):
+    _dirty.update(post_ids)
+
+
+def hot_score():
+    # Reddit-style hot ranking. Recency is measured from the epoch rather than
+    # from now, so a post's score only moves when its votes do.
+    return (
+        func.log(func.greatest(models.Post.votes_count, 1))
+        + func.extract("epoch", models.Post.created_at) / config.settings.trending_gravity_seconds
+    )
+
+
+def refresh_statement(post_ids: Optional[Iterable[int]] = None):
+    """Upsert scores for the given posts, or for every post when None."""
+    scores = select(models.Post.id, hot_score(), func.now()).order_by(models.Post.id)
+    if post_ids is not None:
+        scores = scores.where(models.Post.id.in_(post_ids))
+    stmt = insert(models.PostRanking).from_select(["post_id", "score", "refreshed_at"], scores)
+    return stmt.on_conflict_do_update(
+        index_elements=[models.PostRanking.post_id],
+        set_={"score": stmt.excluded.score, "refreshed_at": stmt.excluded.refreshed_at},
+    )
+
+
+async def refresh_dirty(db) -> int:
+    post_ids = sorted(_dirty)
+    if not post_ids:
+        return 0
+    _dirty.difference_update(post_ids)
+    try:
+        await db.execute(refresh_statement(post_ids))
+        await db.commit()
+    except BaseException:
+        # Try again on the next tick; also when cancelled at shutdown, so
+        # the final refresh still covers these
+        _dirty.update(post_ids)
+        raise
+    return len(post_ids)
+
+
+async def refresh_once():
+    db = database.open_session()
+    try:
+        await refresh_dirty(db)
+    except Exception:
+        logger.exception("Refreshing post rankings failed")
+    finally:
+        await db.close()
+
+
+async def refresh_loop(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        await refresh_once()
@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy import lambda_stmt, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
 from app import models, schemas, utils, oauth2
+from app.throttle import login_throttle
 from app.database import get_db
 from fastapi.security.oauth2 import OAuth2PasswordRequestForm
 # FastAPI router
@@ -20,15 +22,33 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def user_by_email(email: str):
+    # Built and cache-keyed once; each login only binds the email
+    return lambda_stmt(lambda: select(models.User).where(models.User.email == email))
+
+
 @router.post("/login", response_model=schemas.Token)
-def login(user_credentials: OAuth2PasswordRequestForm=Depends(), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == user_credentials.username).first()
+async def login(request: Request, user_credentials: OAuth2PasswordRequestForm=Depends(), db: AsyncSession = Depends(get_db)):
+    # Refuse over-limit attempts before they cost a query and a bcrypt verify
+    if login_throttle is not None:
+        await login_throttle.check(request, user_credentials.username)
+
+    user = await db.scalar(user_by_email(user_credentials.username))
     
-    if not user or not utils.verify(user_credentials.password, user.password):
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = await utils.verify_and_update_async(user_credentials.password, user.password)
+
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Invalid Credentials"
         )
+
+    # The bcrypt cost was changed since this hash was made; store the upgrade
+    if new_hash:
+        user.password = new_hash
+        await db.commit()
     
     # Generate JWT token
     access_token = oauth2.create_access_token(data={"user_id": user.id})
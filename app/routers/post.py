@@ -1,145 +1,340 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from typing import List
-from app import models, schemas, oauth2
-from app.database import SessionLocal
-from sqlalchemy import func
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Literal
+from app import models, schemas, oauth2, pagination, cache, conditional, config, rankings, serializers, export
+from app.database import get_db, get_read_db, record_write, wrote_recently
+from sqlalchemy import func, insert, lambda_stmt, select, tuple_
+from sqlalchemy.orm import load_only
+from datetime import datetime
 
 router = APIRouter(
     prefix="/posts",
     tags=['Posts']
 )
 
-# ----------------- DB Dependency -----------------
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+
+# ----------------- Listing Sorts -----------------
+# sort name -> (indexed column, cursor key parser, id column of the same index)
+SORTS = {
+    "new": (models.Post.created_at, datetime.fromisoformat, models.Post.id),
+    "votes": (models.Post.votes_count, int, models.Post.id),
+    # Posts only rank once app.rankings has scored them
+    "top": (models.PostRanking.score, float, models.PostRanking.post_id),
+}
+
+
+def _post_filters(search: str, mode: str, published: Optional[bool]) -> list:
+    """WHERE clauses shared by the listing and the export."""
+    filters = []
+    if search:
+        if mode == "fts":
+            filters.append(models.Post.search_vector.op("@@")(func.websearch_to_tsquery("english", search)))
+        else:
+            filters.append(models.Post.title.contains(search))
+    if published is not None:
+        filters.append(models.Post.published == published)
+    return filters
+
+
+# ----------------- Cache Headers -----------------
+# Listings depend on the caller's auth, so only private caches may keep them
+LISTING_CACHE_CONTROL = "private, no-cache"
+
+
+def _post_headers(post_id: int, updated_at: datetime, field_set: Optional[serializers.FieldSet] = None) -> dict:
+    # updated_at moves on every edit and vote, so it versions the whole post;
+    # each field set is a different representation of it
+    etag = conditional.make_etag("post", post_id, updated_at.timestamp(), field_set)
+    cache_control = f"public, max-age={config.settings.post_cache_max_age}, must-revalidate"
+    return conditional.cache_headers(etag, cache_control, updated_at)
+
+
+def _listing_headers(request: Request, versions, limit: int, cursor_sort: Optional[str]) -> dict:
+    """ETag, Last-Modified and X-Next-Cursor for (id, updated_at, sort key) rows
+    of a page fetched with one extra row."""
+    page_rows = versions[:limit]
+    has_more = len(versions) > limit
+    etag = conditional.make_etag(
+        request.url.path, request.url.query,
+        [(post_id, updated_at.timestamp()) for post_id, updated_at, _ in page_rows], has_more
+    )
+    headers = conditional.cache_headers(
+        etag, LISTING_CACHE_CONTROL, conditional.latest(updated_at for _, updated_at, _ in page_rows)
+    )
+    if has_more and cursor_sort:
+        last_id, _, last_key = page_rows[-1]
+        headers["X-Next-Cursor"] = pagination.encode_cursor(cursor_sort, last_key, last_id)
+    return headers
+
+
+# ----------------- Sparse Fieldsets -----------------
+FIELDS_QUERY = Query(None, description="Comma-separated post fields to return, e.g. id,title; id is always included")
+OWNER_FIELDS_QUERY = Query(None, description="Comma-separated owner fields to return; implies the owner")
 
 
 # ----------------- Create Post -----------------
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=schemas.PostOut)
-def create_post(
+async def create_post(
     post: schemas.PostCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(oauth2.get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: schemas.UserOut = Depends(oauth2.get_current_user)
 ):
-    db_post = models.Post(owner_id=current_user.id, **post.dict())
+    db_post = models.Post(owner_id=current_user.id, **post.model_dump())
     db.add(db_post)
-    db.commit()
-    db.refresh(db_post)
+    await record_write(db, current_user.id)
+    await db.commit()
+    await db.refresh(db_post)
+    rankings.mark_dirty([db_post.id])
 
-    return {"Post": schemas.PostSchema.model_validate({
-        **db_post.__dict__,
-        "owner": current_user
-    }), "votes": 0}
+    return serializers.render_post(db_post, current_user, status_code=status.HTTP_201_CREATED)
+
+
+# ----------------- Bulk Create Posts -----------------
+@router.post("/bulk", status_code=status.HTTP_201_CREATED, response_model=List[schemas.PostOut])
+async def create_posts_bulk(
+    posts: List[schemas.PostCreate],
+    db: AsyncSession = Depends(get_db),
+    current_user: schemas.UserOut = Depends(oauth2.get_current_user)
+):
+    if len(posts) > config.settings.post_bulk_limit:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"at most {config.settings.post_bulk_limit} posts per request"
+        )
+    if not posts:
+        return serializers.render_posts([], {}, status_code=status.HTTP_201_CREATED)
+
+    # One multi-row INSERT ... RETURNING (per 1000 rows, SQLAlchemy's
+    # insertmanyvalues batch), handed back in request order
+    created = (await db.scalars(
+        insert(models.Post).returning(models.Post, sort_by_parameter_order=True),
+        [{"owner_id": current_user.id, **post.model_dump()} for post in posts]
+    )).all()
+
+    # Read before commit: on the psycopg2 path commit expires the rows
+    rendered = serializers.render_posts(
+        created, {current_user.id: current_user}, status_code=status.HTTP_201_CREATED
+    )
+    created_ids = [post.id for post in created]
+    await record_write(db, current_user.id)
+    await db.commit()
+    rankings.mark_dirty(created_ids)
+    return rendered
 
 
 # ----------------- Get All Posts -----------------
+def listing_page(limit: int, skip: int, cursor: Optional[str], search: str, mode: str, sort: str, published: Optional[bool]):
+    """The listing's page as a subquery of ids and sort keys, with one extra
+    row, plus the sort key's column name, the page order and the cursor sort."""
+    filters = _post_filters(search, mode, published)
+
+    # Pick the page ids (plus their sort keys) from an index first, then load
+    # posts and owners for just those rows.
+    if search and mode == "fts":
+        if cursor:
+            raise HTTPException(status_code=400, detail="cursor paging is not supported with mode=fts, use skip")
+        ts_query = func.websearch_to_tsquery("english", search)
+        sort_column = func.ts_rank(models.Post.search_vector, ts_query).label("rank")
+        id_column = models.Post.id
+        page = select(models.Post.id, sort_column).where(*filters)
+    else:
+        sort_column, parse_key, id_column = SORTS[sort]
+        page = select(id_column.label("id"), sort_column)
+        if id_column is not models.Post.id:
+            page = page.join(models.Post, models.Post.id == id_column)
+        page = page.where(*filters)
+        if cursor:
+            key, last_id = pagination.decode_cursor(cursor, sort, parse_key)
+            page = page.where(tuple_(sort_column, id_column) < tuple_(key, last_id))
+
+    # The extra row only tells us whether another page exists
+    page = page.order_by(sort_column.desc(), id_column.desc())
+    if not cursor:
+        page = page.offset(skip)
+    page = page.limit(limit + 1).subquery()
+    page_order = (page.c[sort_column.key].desc(), page.c.id.desc())
+    cursor_sort = None if search and mode == "fts" else sort
+    return page, sort_column.key, page_order, cursor_sort
+
+
+def listing_posts(page, sort_key: str, page_order, field_set: Optional[serializers.FieldSet]):
+    """Posts of a listing_page() with their sort keys, in page order."""
+    posts_query = (
+        select(models.Post, page.c[sort_key])
+        .join(page, page.c.id == models.Post.id)
+        .order_by(*page_order)
+    )
+    if field_set is not None:
+        # Large bodies are never read when the client did not ask for them
+        posts_query = posts_query.options(load_only(*serializers.load_columns(field_set)))
+    return posts_query
+
+
 @router.get("/", response_model=List[schemas.PostOut])
-def get_posts(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(oauth2.get_current_user),
+async def get_posts(
+    request: Request,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: schemas.UserOut = Depends(oauth2.get_current_user),
     limit: int = Query(10, ge=1),
-    skip: int = Query(0, ge=0),
-    search: str = Query("", description="Search posts by title")
+    skip: int = Query(0, ge=0, description="Legacy offset paging, ignored when cursor is set"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header"),
+    search: str = Query("", description="Search posts by title, or by title and content with mode=fts"),
+    mode: Literal["substring", "fts"] = Query("substring", description="substring: title contains search; fts: ranked word search"),
+    sort: Literal["new", "votes", "top"] = Query("new", description="Ignored by mode=fts, which sorts by rank"),
+    published: Optional[bool] = Query(None, description="Only published (true) or draft (false) posts"),
+    fields: Optional[str] = FIELDS_QUERY,
+    owner_fields: Optional[str] = OWNER_FIELDS_QUERY
 ):
-    posts_with_votes = (
-        db.query(
-            models.Post,
-            func.count(models.Vote.post_id).label("votes")
-        )
-        .join(models.Vote, models.Vote.post_id == models.Post.id, isouter=True)
-        .filter(models.Post.title.contains(search))
-        .group_by(models.Post.id)
-        .offset(skip)
-        .limit(limit)
-        .all()
+    field_set = serializers.parse_fields(fields, owner_fields)
+    page, sort_key, page_order, cursor_sort = listing_page(limit, skip, cursor, search, mode, sort, published)
+
+    # Revalidation only needs each row's version, not the posts themselves
+    if "if-none-match" in request.headers:
+        versions = (await db.execute(
+            select(models.Post.id, models.Post.updated_at, page.c[sort_key])
+            .join(page, page.c.id == models.Post.id)
+            .order_by(*page_order)
+        )).all()
+        headers = _listing_headers(request, versions, limit, cursor_sort)
+        if conditional.etag_matches(request, headers["ETag"]):
+            return conditional.not_modified(headers)
+
+    rows = (await db.execute(listing_posts(page, sort_key, page_order, field_set))).all()
+
+    versions = [(post.id, post.updated_at, key) for post, key in rows]
+    headers = _listing_headers(request, versions, limit, cursor_sort)
+    posts = [post for post, _ in rows[:limit]]
+
+    # Owners come from the user cache; any misses are fetched in one query
+    owners = {}
+    if field_set is None or field_set.owner:
+        owners = await cache.get_users(db, (post.owner_id for post in posts))
+
+    return serializers.render_posts(posts, owners, headers=headers, field_set=field_set)
+
+
+# ----------------- Trending Posts -----------------
+@router.get("/trending", response_model=List[schemas.PostOut])
+async def get_trending_posts(
+    request: Request,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: schemas.UserOut = Depends(oauth2.get_current_user),
+    limit: int = Query(10, ge=1),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header"),
+    fields: Optional[str] = FIELDS_QUERY,
+    owner_fields: Optional[str] = OWNER_FIELDS_QUERY
+):
+    return await get_posts(
+        request, db, current_user,
+        limit=limit, skip=0, cursor=cursor, search="", mode="substring", sort="top",
+        published=None, fields=fields, owner_fields=owner_fields
     )
 
-    results = []
-    for post, votes in posts_with_votes:
-        owner = db.query(models.User).filter(models.User.id == post.owner_id).first()
-        results.append({
-            "Post": schemas.PostSchema.model_validate({
-                **post.__dict__,
-                "owner": owner
-            }),
-            "votes": votes
-        })
 
-    return results
+# ----------------- Export Posts -----------------
+@router.get("/export", response_class=StreamingResponse)
+async def export_posts(
+    current_user: schemas.UserOut = Depends(oauth2.get_current_user),
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+    search: str = Query("", description="Same as the listing's search"),
+    mode: Literal["substring", "fts"] = Query("substring"),
+    published: Optional[bool] = Query(None, description="Only published (true) or draft (false) posts")
+):
+    query = (
+        select(*export.EXPORT_COLUMNS)
+        .where(*_post_filters(search, mode, published))
+        .order_by(models.Post.id)
+    )
+    # The body outlives this handler's dependencies, so the stream opens its
+    # own session
+    replica = not await wrote_recently(current_user.id)
+    return StreamingResponse(
+        export.stream_rows(query, format, replica=replica),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="posts.{format}"'},
+    )
 
 
 # ----------------- Get Single Post -----------------
+def post_version(post_id: int):
+    # Every revalidation runs this; the lambda skips rebuilding it each time
+    return lambda_stmt(lambda: select(models.Post.updated_at).where(models.Post.id == post_id))
+
+
 @router.get("/{id}", response_model=schemas.PostOut)
-def get_post(id: int, db: Session = Depends(get_db)):
-    post_with_votes = (
-        db.query(
-            models.Post,
-            func.count(models.Vote.post_id).label("votes")
-        )
-        .join(models.Vote, models.Vote.post_id == models.Post.id, isouter=True)
-        .filter(models.Post.id == id)
-        .group_by(models.Post.id)
-        .first()
-    )
+async def get_post(
+    id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_read_db),
+    fields: Optional[str] = FIELDS_QUERY,
+    owner_fields: Optional[str] = OWNER_FIELDS_QUERY
+):
+    field_set = serializers.parse_fields(fields, owner_fields)
+
+    # A revalidating client only needs the post's version
+    if "if-none-match" in request.headers or "if-modified-since" in request.headers:
+        updated_at = await db.scalar(post_version(id))
+        if updated_at is None:
+            raise HTTPException(status_code=404, detail=f"Post {id} not found")
+        headers = _post_headers(id, updated_at, field_set)
+        if conditional.is_fresh(request, headers["ETag"], updated_at):
+            return conditional.not_modified(headers)
+
+    options = [] if field_set is None else [load_only(*serializers.load_columns(field_set))]
+    post = await db.get(models.Post, id, options=options)
 
-    if not post_with_votes:
+    if not post:
         raise HTTPException(status_code=404, detail=f"Post {id} not found")
 
-    post, votes = post_with_votes
-    owner = db.query(models.User).filter(models.User.id == post.owner_id).first()
+    owner = None
+    if field_set is None or field_set.owner:
+        owner = await cache.get_user(db, post.owner_id)
 
-    return {"Post": schemas.PostSchema.model_validate({
-        **post.__dict__,
-        "owner": owner
-    }), "votes": votes}
+    return serializers.render_post(
+        post, owner, headers=_post_headers(post.id, post.updated_at, field_set), field_set=field_set
+    )
 
 
 # ----------------- Update Post -----------------
 @router.put("/{id}", response_model=schemas.PostOut)
-def update_post(
+async def update_post(
     id: int,
     updated_post: schemas.PostCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(oauth2.get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: schemas.UserOut = Depends(oauth2.get_current_user)
 ):
-    post = db.query(models.Post).filter(models.Post.id == id).first()
+    post = await db.get(models.Post, id)
     if not post:
         raise HTTPException(status_code=404, detail=f"Post {id} not found")
 
     if post.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to update this post")
 
-    for key, value in updated_post.dict().items():
+    for key, value in updated_post.model_dump().items():
         setattr(post, key, value)
+    post.updated_at = func.clock_timestamp()
+    await record_write(db, current_user.id)
 
-    db.commit()
-    db.refresh(post)
-
-    votes = db.query(func.count(models.Vote.post_id)).filter(models.Vote.post_id == id).scalar()
+    await db.commit()
+    await db.refresh(post)
 
-    return {"Post": schemas.PostSchema.model_validate({
-        **post.__dict__,
-        "owner": current_user
-    }), "votes": votes}
+    return serializers.render_post(post, current_user)
 # ----------------- Delete Post -----------------
 @router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_post(
+async def delete_post(
     id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(oauth2.get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: schemas.UserOut = Depends(oauth2.get_current_user)
 ):
-    post = db.query(models.Post).filter(models.Post.id == id).first()
+    post = await db.get(models.Post, id)
     if not post:
         raise HTTPException(status_code=404, detail=f"Post {id} not found")
 
     if post.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this post")
 
-    db.delete(post)
-    db.commit()
+    await db.delete(post)
+    await record_write(db, current_user.id)
+    await db.commit()
     return
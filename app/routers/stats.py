@@ -0,0 +1,52 @@
+from typing import Optional
+from anyio import to_thread
+from fastapi import APIRouter, Depends, Request
+from pydantic import BaseModel, Field
+from app import cache, database, oauth2
+
+router = APIRouter(
+    prefix="/stats",
+    tags=['Stats']
+)
+
+
+# ----------------- Cache Stats -----------------
+@router.get("/cache")
+def cache_stats():
+    return {"users": cache.user_cache.stats()}
+
+
+# ----------------- Pool Stats -----------------
+@router.get("/pool")
+async def pool_stats():
+    limiter = to_thread.current_default_thread_limiter()
+    return {
+        "engines": database.pool_stats(),
+        "threadpool": {"limit": limiter.total_tokens, "busy": limiter.borrowed_tokens},
+    }
+
+
+# ----------------- Startup -----------------
+@router.get("/startup")
+def startup_stats(request: Request):
+    # Milliseconds per warm-up step of this worker; empty when it was skipped
+    return {"warmup_ms": getattr(request.app.state, "warmup_ms", {})}
+
+
+# ----------------- SQL Profiling -----------------
+class ProfilingUpdate(BaseModel):
+    enabled: Optional[bool] = None
+    slow_query_ms: Optional[float] = Field(None, ge=0)
+    explain_sample_rate: Optional[float] = Field(None, ge=0, le=1)
+
+
+@router.get("/profiling")
+async def get_profiling():
+    await database.profiling.refresh(force=True)
+    return database.profiling.as_dict()
+
+
+# Shared by every worker through the sql_profiling table
+@router.put("/profiling", dependencies=[Depends(oauth2.require_admin)])
+async def update_profiling(update: ProfilingUpdate):
+    return await database.profiling.update(**update.model_dump(exclude_none=True))
@@ -1,39 +1,35 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from app import models, schemas, utils
-from app.database import SessionLocal
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import models, schemas, utils, cache, rankings
+from app.database import get_db, get_read_db, record_write
 
 router = APIRouter(prefix=
     "/users",
     tags=['users'] 
 )
 
-# DB dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 
 # Create user
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=schemas.UserOut)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    hashed_password = utils.hash(user.password)
-    user_data = user.dict()
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
+    hashed_password = await utils.hash_async(user.password)
+    user_data = user.model_dump()
     user_data["password"] = hashed_password
     new_user = models.User(**user_data)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    # The id is needed for the read-your-writes window
+    await db.flush()
+    await record_write(db, new_user.id)
+    await db.commit()
+    await db.refresh(new_user)
     return new_user
 
 
 # Get user by ID
 @router.get("/{id}", response_model=schemas.UserOut)
-def get_user(id: int, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == id).first()
+async def get_user(id: int, db: AsyncSession = Depends(get_read_db)):
+    user = await db.get(models.User, id)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"user with id {id} not found")
     return user
@@ -41,30 +37,45 @@ def get_user(id: int, db: Session = Depends(get_db)):
 
 # Update user by ID
 @router.put("/{id}", response_model=schemas.UserOut)
-def update_user(id: int, updated_user: schemas.UserCreate, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == id).first()
+async def update_user(id: int, updated_user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
+    user = await db.get(models.User, id)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"user with id {id} not found")
 
-    user_data = updated_user.dict()
+    user_data = updated_user.model_dump()
     if "password" in user_data:
-        user_data["password"] = utils.hash(user_data["password"])
+        user_data["password"] = await utils.hash_async(user_data["password"])
     
     for key, value in user_data.items():
         setattr(user, key, value)
+    await record_write(db, id)
 
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
+    cache.user_cache.invalidate(id)
     return user
 
 
 # Delete user by ID
 @router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_user(id: int, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == id).first()
+async def delete_user(id: int, db: AsyncSession = Depends(get_db)):
+    user = await db.get(models.User, id)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"user with id {id} not found")
-    
-    db.delete(user)
-    db.commit()
+
+    # The user's votes go with them via ON DELETE CASCADE; take them off the
+    # post counters in the same transaction
+    voted_posts = select(models.Vote.post_id).where(models.Vote.user_id == id)
+    unvoted = await db.scalars(
+        update(models.Post)
+        .where(models.Post.id.in_(voted_posts))
+        .values(votes_count=models.Post.votes_count - 1, updated_at=func.clock_timestamp())
+        .returning(models.Post.id)
+        .execution_options(synchronize_session=False)
+    )
+    unvoted_ids = unvoted.all()
+    await db.delete(user)
+    await db.commit()
+    cache.user_cache.invalidate(id)
+    rankings.mark_dirty(unvoted_ids)
     return {"detail": f"user with id {id} deleted"}
@@ -1,34 +1,166 @@
+from typing import List
 from fastapi import APIRouter, Depends, HTTPException, status, responses
-from sqlalchemy.orm import Session
+from sqlalchemy import Integer, bindparam, delete, func, lambda_stmt, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from .. import models, schemas, oauth2, database
-from app.database import get_db
+from app import config, rankings
+from app.database import get_db, record_write
 router = APIRouter(
     prefix="/vote",
     tags=['Votes']
     )
 
+# Postgres SQLSTATE for foreign_key_violation
+FOREIGN_KEY_VIOLATION = "23503"
+
+
+def _bump_votes_count(changed_votes, delta: int):
+    # One statement: the vote write runs as a CTE and the counter update joins
+    # on whatever row it returned, so nothing happens when it was a no-op
+    return (
+        update(models.Post)
+        .where(models.Post.id == changed_votes.c.post_id)
+        .values(votes_count=models.Post.votes_count + delta, updated_at=func.clock_timestamp())
+        .returning(models.Post.id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+# ----------------- Statements -----------------
+# Built with lambda_stmt: each is constructed and its cache key computed once
+# per call site, later calls only swap in the bound values. ON CONFLICT
+# clauses have no cache key of their own, so as plain inserts these were
+# compiled again on every request.
+def _add_vote(post_id: int, user_id: int):
+    return lambda_stmt(lambda: _bump_votes_count(
+        insert(models.Vote)
+        .values(post_id=post_id, user_id=user_id)
+        .on_conflict_do_nothing()
+        .returning(models.Vote.post_id)
+        .cte("inserted"),
+        1,
+    ))
+
+
+def _remove_vote(post_id: int, user_id: int):
+    return lambda_stmt(lambda: _bump_votes_count(
+        delete(models.Vote)
+        .where(models.Vote.post_id == post_id, models.Vote.user_id == user_id)
+        .returning(models.Vote.post_id)
+        .cte("deleted"),
+        -1,
+    ))
+
+
+def _post_exists(post_id: int):
+    return lambda_stmt(lambda: select(models.Post.id).where(models.Post.id == post_id))
+
+
+# One array parameter instead of a VALUES row per vote, so batches of any
+# size share one compiled statement; run with post_ids and user_id. On the
+# table rather than the entity, as in app/throttle.py. The parameters live
+# outside the lambda, which does not resolve ARRAY(Integer) inside it.
+_batch_post_ids = bindparam("post_ids", type_=ARRAY(Integer))
+_batch_user_id = bindparam("user_id", type_=Integer)
+_add_votes = lambda_stmt(lambda: (
+    insert(models.Vote.__table__)
+    .from_select(["post_id", "user_id"], select(func.unnest(_batch_post_ids), _batch_user_id))
+    .on_conflict_do_nothing()
+    .returning(models.Vote.__table__.c.post_id)
+))
+
+
 @router.post("/", status_code=status.HTTP_201_CREATED)
-def vote(vote: schemas.Vote, db: Session = Depends(get_db), current_user: models.User = Depends(oauth2.get_current_user)):
-    post = db.query(models.Post).filter(models.Post.id == vote.post_id).first()
-    
-    if not post:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Post with id {vote.post_id} does not exist")
-    
-    vote_query = db.query(models.Vote).filter(models.Vote.post_id == vote.post_id, models.Vote.user_id == current_user.id)
-    found_vote = vote_query.first()
-    
+async def vote(vote: schemas.Vote, db: AsyncSession = Depends(get_db), current_user: schemas.UserOut = Depends(oauth2.get_current_user)):
+    post_missing = HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Post with id {vote.post_id} does not exist")
+
     if (vote.dir == 1):
-        if found_vote:
+        try:
+            counted = await db.scalar(_add_vote(vote.post_id, current_user.id))
+        except IntegrityError as e:
+            await db.rollback()
+            if getattr(e.orig, "pgcode", None) == FOREIGN_KEY_VIOLATION:
+                raise post_missing
+            raise
+        if counted is None:
+            await db.rollback()
             raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"user {current_user.id} has already voted on post {vote.post_id}")
-        
-        new_vote = models.Vote(post_id=vote.post_id, user_id=current_user.id)
-        db.add(new_vote)
-        db.commit()
+
+        await record_write(db, current_user.id)
+        await db.commit()
+        rankings.mark_dirty([vote.post_id])
         return {"message": "successfully added vote"}
     else:
-        if not found_vote:
+        counted = await db.scalar(_remove_vote(vote.post_id, current_user.id))
+        if counted is None:
+            # Only the failure path pays for telling the two 404s apart
+            post_exists = await db.scalar(_post_exists(vote.post_id))
+            await db.rollback()
+            if post_exists is None:
+                raise post_missing
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Vote does not exist")
-        
-        vote_query.delete(synchronize_session=False)
-        db.commit()
-        return {"message": "successfully deleted vote"}
\ No newline at end of file
+
+        await record_write(db, current_user.id)
+        await db.commit()
+        rankings.mark_dirty([vote.post_id])
+        return {"message": "successfully deleted vote"}
+
+
+@router.post("/batch", response_model=List[schemas.VoteResult])
+async def vote_batch(votes: List[schemas.Vote], db: AsyncSession = Depends(get_db), current_user: schemas.UserOut = Depends(oauth2.get_current_user)):
+    if len(votes) > config.settings.vote_batch_limit:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"at most {config.settings.vote_batch_limit} votes per batch")
+
+    # Items are replayed in order, so only the last one per post counts
+    last_index = {vote.post_id: index for index, vote in enumerate(votes)}
+    final_dir = {post_id: votes[index].dir for post_id, index in last_index.items()}
+    post_ids = sorted(final_dir)
+
+    # KEY SHARE keeps these posts from being deleted before the votes land
+    existing = set((await db.scalars(
+        select(models.Post.id).where(models.Post.id.in_(post_ids)).with_for_update(key_share=True)
+    )).all())
+    upvote_ids = [post_id for post_id in post_ids if post_id in existing and final_dir[post_id] == 1]
+    removal_ids = [post_id for post_id in post_ids if post_id in existing and final_dir[post_id] != 1]
+
+    added, removed = set(), set()
+    if upvote_ids:
+        added = set((await db.scalars(
+            _add_votes, {"post_ids": upvote_ids, "user_id": current_user.id}
+        )).all())
+    if removal_ids:
+        removed = set((await db.scalars(
+            delete(models.Vote)
+            .where(models.Vote.user_id == current_user.id, models.Vote.post_id.in_(removal_ids))
+            .returning(models.Vote.post_id)
+        )).all())
+
+    for changed, delta in ((added, 1), (removed, -1)):
+        if changed:
+            await db.execute(
+                update(models.Post)
+                .where(models.Post.id.in_(changed))
+                .values(votes_count=models.Post.votes_count + delta, updated_at=func.clock_timestamp())
+                .execution_options(synchronize_session=False)
+            )
+    if added or removed:
+        await record_write(db, current_user.id)
+    await db.commit()
+    if added or removed:
+        rankings.mark_dirty(added | removed)
+
+    results = []
+    for index, vote in enumerate(votes):
+        if vote.post_id not in existing:
+            outcome = "post_not_found"
+        elif last_index[vote.post_id] != index:
+            outcome = "superseded"
+        elif vote.dir == 1:
+            outcome = "added" if vote.post_id in added else "already_voted"
+        else:
+            outcome = "removed" if vote.post_id in removed else "vote_not_found"
+        results.append({"post_id": vote.post_id, "dir": vote.dir, "status": outcome})
+    return results
\ No newline at end of file
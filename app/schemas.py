@@ -77,8 +77,15 @@ class TokenData(BaseModel):
 
 
 # ----------------- Votes -----------------
-from typing import Annotated
+from typing import Annotated, Literal
 
 class Vote(BaseModel):
     post_id: int
     dir: Annotated[int, 0<= 1]  # 1 = upvote, 0 = remove vote
+
+
+class VoteResult(BaseModel):
+    post_id: int
+    dir: int
+    # added / removed, or why the item was skipped
+    status: Literal["added", "removed", "already_voted", "vote_not_found", "post_not_found", "superseded"]
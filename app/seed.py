@@ -0,0 +1,179 @@
+import csv
+import io
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable, List
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from app import rankings, utils
+
+
+# Small vocabulary so full-text search and trigram plans see repeated words
+WORDS = (
+    "api async cache cursor database deploy docker engine fastapi index "
+    "latency migration network orm pagination pool postgres python query "
+    "replica request response schema search server session sql stream test "
+    "thread token trending upvote vote worker"
+).split()
+
+SEED_TABLES = ("votes", "post_rankings", "posts", "users")
+COPY_CHUNK_ROWS = 100_000
+# Timestamps count back from a fixed instant so runs are reproducible
+SEED_NOW = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+@dataclass
+class SeedOptions:
+    users: int = 1000
+    posts: int = 10_000
+    votes: int = 100_000
+    # Zipf exponent of post popularity; larger is more skewed
+    zipf: float = 1.2
+    seed: int = 0
+    password: str = "password"
+    # 0 reuses one precomputed hash for every user; otherwise each user gets
+    # their own salt, hashed across this many processes
+    hash_workers: int = 0
+    days: int = 365
+    truncate: bool = False
+
+
+@dataclass
+class SeedResult:
+    users: int
+    posts: int
+    votes: int
+    seconds: float
+
+
+def generate_votes(rng: np.random.Generator, users: int, posts: int, votes: int, zipf: float):
+    """Unique (user_id, post_id) pairs with Zipf-distributed post popularity.
+
+    Popularity ranks are shuffled over the post ids so the hot posts are not
+    simply the oldest ones. Returns fewer than `votes` pairs if the skew makes
+    the target unreachable.
+    """
+    votes = min(votes, users * posts)
+    popularity = rng.permutation(posts)
+    keys = np.empty(0, dtype=np.int64)
+    for _ in range(20):
+        missing = votes - len(keys)
+        if missing <= 0:
+            break
+        draw = int(missing * 1.25) + 16
+        ranks = np.minimum(rng.zipf(zipf, draw), posts) - 1
+        post_ids = popularity[ranks].astype(np.int64) + 1
+        user_ids = rng.integers(1, users + 1, draw, dtype=np.int64)
+        keys = np.unique(np.concatenate([keys, user_ids * (posts + 1) + post_ids]))
+    if len(keys) > votes:
+        keys = rng.choice(keys, votes, replace=False)
+        keys.sort()
+    return keys // (posts + 1), keys % (posts + 1)
+
+
+def hash_passwords(password: str, count: int, workers: int) -> Iterable[str]:
+    if workers <= 0:
+        shared = utils.hash(password)
+        return (shared for _ in range(count))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return list(pool.map(utils.hash, [password] * count, chunksize=max(count // (workers * 8), 1)))
+
+
+def _copy(cursor, table: str, columns: List[str], rows: Iterable[tuple]):
+    """COPY rows into table, one buffer of COPY_CHUNK_ROWS at a time."""
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    buffer, writer, pending = io.StringIO(), None, 0
+    for row in rows:
+        if writer is None:
+            writer = csv.writer(buffer)
+        writer.writerow(row)
+        pending += 1
+        if pending == COPY_CHUNK_ROWS:
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+            buffer, writer, pending = io.StringIO(), None, 0
+    if pending:
+        buffer.seek(0)
+        cursor.copy_expert(sql, buffer)
+
+
+def _timestamps(rng: np.random.Generator, count: int, days: int, now: datetime) -> List[str]:
+    offsets = rng.uniform(0, days * 86400, count)
+    return [(now - timedelta(seconds=float(offset))).isoformat() for offset in offsets]
+
+
+def _post_rows(rng: np.random.Generator, options: SeedOptions, votes_count: np.ndarray, now: datetime):
+    owners = rng.integers(1, options.users + 1, options.posts)
+    published = rng.random(options.posts) < 0.9
+    created = _timestamps(rng, options.posts, options.days, now)
+    lengths = rng.integers(20, 200, options.posts)
+    words = rng.integers(0, len(WORDS), int(lengths.sum()))
+    start = 0
+    for i in range(options.posts):
+        body = words[start:start + lengths[i]]
+        start += lengths[i]
+        title = " ".join(WORDS[w] for w in body[:6])
+        content = " ".join(WORDS[w] for w in body)
+        yield (title, content, bool(published[i]), created[i], created[i], int(owners[i]), int(votes_count[i + 1]))
+
+
+def seed_database(engine: Engine, options: SeedOptions, log: Callable[[str], None] = print) -> SeedResult:
+    """Load reproducible users, posts and votes with COPY.
+
+    The same options give the same rows (bar bcrypt salts). Ids come out as
+    1..N, so the target tables must be empty or truncated first; their id
+    sequences are restarted either way.
+    """
+    started = time.perf_counter()
+    rng = np.random.default_rng(options.seed)
+    now = SEED_NOW
+
+    with engine.connect() as conn:
+        if not options.truncate and conn.execute(
+            text("SELECT EXISTS (SELECT 1 FROM users) OR EXISTS (SELECT 1 FROM posts)")
+        ).scalar():
+            raise RuntimeError("users/posts are not empty; pass truncate to replace them")
+        # Also when they are empty: rows deleted earlier leave the sequences
+        # past 1, and the generated owner and vote ids assume 1..N
+        conn.execute(text(f"TRUNCATE {', '.join(SEED_TABLES)} RESTART IDENTITY CASCADE"))
+        conn.commit()
+
+    # Votes first: their per-post counts go straight into posts.votes_count
+    vote_users, vote_posts = generate_votes(rng, options.users, options.posts, options.votes, options.zipf)
+    votes_count = np.bincount(vote_posts, minlength=options.posts + 1)
+    log(f"generated {len(vote_users)} votes")
+
+    passwords = hash_passwords(options.password, options.users, options.hash_workers)
+    log(f"hashed {options.users} passwords")
+
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        user_created = _timestamps(rng, options.users, options.days, now)
+        _copy(cursor, "users", ["email", "password", "created_at"], (
+            (f"user{i + 1}@example.com", password, user_created[i])
+            for i, password in enumerate(passwords)
+        ))
+        log(f"copied {options.users} users")
+        _copy(cursor, "posts", ["title", "content", "published", "created_at", "updated_at", "owner_id", "votes_count"],
+              _post_rows(rng, options, votes_count, now))
+        log(f"copied {options.posts} posts")
+        _copy(cursor, "votes", ["user_id", "post_id"], zip(vote_users.tolist(), vote_posts.tolist()))
+        log(f"copied {len(vote_users)} votes")
+        raw.commit()
+    finally:
+        raw.close()
+
+    with engine.connect() as conn:
+        conn.execute(rankings.refresh_statement())
+        conn.commit()
+        # Fresh statistics so query plans reflect the new data right away
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text(f"ANALYZE {', '.join(SEED_TABLES)}"))
+
+    return SeedResult(options.users, options.posts, len(vote_users), time.perf_counter() - started)
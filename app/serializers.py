@@ -0,0 +1,143 @@
+import functools
+import operator
+from typing import List, NamedTuple, Optional, Tuple
+
+import orjson
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+from pydantic import ConfigDict, TypeAdapter, create_model
+
+from app import models, schemas
+
+
+# Built once at import rather than per request
+post_out_adapter = TypeAdapter(schemas.PostOut)
+post_out_list_adapter = TypeAdapter(List[schemas.PostOut])
+
+_POST_FIELDS = tuple(name for name in schemas.PostSchema.model_fields if name != "owner")
+_loaded_post_fields = operator.itemgetter(*_POST_FIELDS)
+
+
+def post_out(post, owner: schemas.UserOut) -> dict:
+    """PostOut input for a Post ORM row and its (cached) owner."""
+    # Loaded values are read straight from the instance dict: going through
+    # the instrumented attributes (or from_attributes) costs more than the
+    # validation itself. Expired rows fall back to a normal load.
+    try:
+        values = _loaded_post_fields(post.__dict__)
+    except KeyError:
+        values = [getattr(post, name) for name in _POST_FIELDS]
+    fields = dict(zip(_POST_FIELDS, values))
+    fields["owner"] = owner
+    return {"Post": fields, "votes": post.votes_count}
+
+
+class ORJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        # OPT_UTC_Z keeps pydantic's "Z" suffix on UTC datetimes
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+
+
+# ----------------- Sparse Fieldsets -----------------
+class FieldSet(NamedTuple):
+    post: Tuple[str, ...]   # PostSchema fields, in schema order, always with id
+    owner: Tuple[str, ...]  # UserOut fields; empty unless post has "owner"
+
+
+def _pick(requested: str, allowed: Tuple[str, ...], kind: str) -> set:
+    names = {name.strip() for name in requested.split(",") if name.strip()}
+    unknown = names - set(allowed)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown {kind} field(s): {', '.join(sorted(unknown))}",
+        )
+    return names
+
+
+def parse_fields(fields: Optional[str], owner_fields: Optional[str]) -> Optional[FieldSet]:
+    """The FieldSet for ?fields=&owner_fields=, or None for full posts."""
+    if fields is None and owner_fields is None:
+        return None
+    all_post, all_owner = tuple(schemas.PostSchema.model_fields), tuple(schemas.UserOut.model_fields)
+    post = _pick(fields, all_post, "post") if fields is not None else set(all_post)
+    post.add("id")
+    owner = set()
+    if owner_fields is not None:
+        # Asking for owner fields implies the owner
+        post.add("owner")
+        owner = _pick(owner_fields, all_owner, "owner") | {"id"}
+    elif "owner" in post:
+        owner = set(all_owner)
+    return FieldSet(
+        post=tuple(name for name in all_post if name in post),
+        owner=tuple(name for name in all_owner if name in owner),
+    )
+
+
+def load_columns(field_set: FieldSet) -> list:
+    """Post columns to load_only(): the requested ones plus what the handlers use."""
+    names = {"id", "votes_count", "updated_at"}
+    names.update(name for name in field_set.post if name != "owner")
+    if field_set.owner:
+        names.add("owner_id")
+    return [getattr(models.Post, name) for name in sorted(names)]
+
+
+@functools.lru_cache(maxsize=256)
+def sparse_adapter(field_set: FieldSet) -> TypeAdapter:
+    """TypeAdapter for List[PostOut] trimmed to field_set, built once per field set."""
+    suffix = "_".join(field_set.post + field_set.owner)
+    post_fields = {}
+    for name in field_set.post:
+        if name == "owner":
+            owner_model = create_model(
+                f"UserOut_{suffix}",
+                __config__=ConfigDict(from_attributes=True),
+                **{owner_name: (schemas.UserOut.model_fields[owner_name].annotation, ...) for owner_name in field_set.owner},
+            )
+            post_fields["owner"] = (owner_model, ...)
+        else:
+            post_fields[name] = (schemas.PostSchema.model_fields[name].annotation, ...)
+    post_model = create_model(f"PostSchema_{suffix}", **post_fields)
+    post_out_model = create_model(f"PostOut_{suffix}", Post=(post_model, ...), votes=(int, ...))
+    return TypeAdapter(List[post_out_model])
+
+
+def sparse_post_out(post, owners: dict, field_set: FieldSet) -> dict:
+    # Only the load_columns() attributes are loaded, so nothing else is
+    # touched; like post_out, an expired row falls back to a normal load
+    state = post.__dict__
+    fields = {
+        name: state[name] if name in state else getattr(post, name)
+        for name in field_set.post if name != "owner"
+    }
+    if field_set.owner:
+        fields["owner"] = owners[post.owner_id]
+    return {"Post": fields, "votes": post.votes_count}
+
+
+# Handlers return these directly, so FastAPI skips its own response_model
+# validation and serialization; response_model stays for the OpenAPI schema.
+def render_post(
+    post, owner: Optional[schemas.UserOut], status_code: int = 200, headers: Optional[dict] = None,
+    field_set: Optional[FieldSet] = None
+) -> ORJSONResponse:
+    if field_set is not None:
+        adapter = sparse_adapter(field_set)
+        validated = adapter.validate_python([sparse_post_out(post, {owner.id: owner} if owner else {}, field_set)])
+        return ORJSONResponse(adapter.dump_python(validated)[0], status_code=status_code, headers=headers)
+    validated = post_out_adapter.validate_python(post_out(post, owner))
+    return ORJSONResponse(post_out_adapter.dump_python(validated), status_code=status_code, headers=headers)
+
+
+def render_posts(
+    posts, owners: dict, status_code: int = 200, headers: Optional[dict] = None,
+    field_set: Optional[FieldSet] = None
+) -> ORJSONResponse:
+    if field_set is not None:
+        adapter = sparse_adapter(field_set)
+        validated = adapter.validate_python([sparse_post_out(post, owners, field_set) for post in posts])
+        return ORJSONResponse(adapter.dump_python(validated), status_code=status_code, headers=headers)
+    validated = post_out_list_adapter.validate_python([post_out(post, owners[post.owner_id]) for post in posts])
+    return ORJSONResponse(post_out_list_adapter.dump_python(validated), status_code=status_code, headers=headers)
@@ -0,0 +1,167 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import HTTPException, Request, status
+from sqlalchemy import Float, String, bindparam, delete, func, lambda_stmt, select
+from sqlalchemy.dialects.postgresql import insert
+
+from app import config, database, metrics, models
+
+
+# ----------------- Backends -----------------
+# A backend keeps one token bucket per key. take() spends a token when one is
+# available and returns 0, otherwise it returns the seconds until one will be.
+class MemoryBackend:
+    """Buckets in this worker only; each gunicorn worker counts separately."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, capacity: float, rate: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens < 1:
+                # Left unchanged, so refusals do not push the next token further out
+                return (1 - tokens) / rate
+            self._buckets[key] = (tokens - 1, now)
+            self._buckets.move_to_end(key)
+            # Evicting the stalest key hands it a full bucket again, which is
+            # what it would have refilled to anyway unless it is very busy
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return 0.0
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+_bucket_key = bindparam("key", type_=String)
+_capacity = bindparam("capacity", type_=Float)
+_rate = bindparam("rate", type_=Float)
+
+
+def _refilled():
+    table = models.LoginThrottle
+    # Time comes from the database so workers with skewed clocks agree
+    return func.least(
+        _capacity, table.tokens + func.extract("epoch", func.clock_timestamp() - table.updated_at) * _rate
+    )
+
+
+# Both run on every login, with key, capacity and rate as parameters. As
+# lambdas they are compiled once; the upsert's ON CONFLICT would otherwise
+# have no cache key and be compiled per attempt.
+# On the table rather than the entity: inside a lambda the ORM's insert adds
+# return_defaults(), which cannot compile alongside returning()
+_take_token = lambda_stmt(lambda: (
+    insert(models.LoginThrottle.__table__)
+    .values(key=_bucket_key, tokens=_capacity - 1, updated_at=func.clock_timestamp())
+    .on_conflict_do_update(
+        index_elements=[models.LoginThrottle.key],
+        set_={"tokens": _refilled() - 1, "updated_at": func.clock_timestamp()},
+        # No row back means this refused the update: out of tokens
+        where=_refilled() >= 1,
+    )
+    .returning(models.LoginThrottle.key)
+))
+_seconds_to_token = lambda_stmt(lambda: (
+    select((1.0 - _refilled()) / _rate).where(models.LoginThrottle.key == _bucket_key)
+))
+
+
+class PostgresBackend:
+    """Buckets in the login_throttle table, shared by every worker and host."""
+
+    # Full buckets are deleted at most this often per worker
+    PRUNE_SECONDS = 60
+
+    def __init__(self):
+        self.next_prune = 0.0
+
+    async def take(self, key: str, capacity: float, rate: float) -> float:
+        params = {"key": key, "capacity": capacity, "rate": rate}
+        db = database.open_session()
+        try:
+            taken = (await db.execute(_take_token, params)).first() is not None
+            wait = 0.0
+            if not taken:
+                wait = await db.scalar(_seconds_to_token, params) or 0.0
+            now = time.monotonic()
+            if now >= self.next_prune:
+                self.next_prune = now + self.PRUNE_SECONDS
+                # A row whose bucket has refilled behaves like a missing one
+                await db.execute(delete(models.LoginThrottle).where(_refilled() >= _capacity), params)
+            await db.commit()
+        finally:
+            await db.close()
+        return max(wait, 0.0)
+
+    def clear(self):
+        pass
+
+
+# ----------------- Login Limits -----------------
+class LoginThrottle:
+    """Token buckets per client IP and per username in front of /login.
+
+    Both are checked before the user lookup and bcrypt verify, so a refused
+    attempt costs neither. The username bucket is spent only once the IP
+    bucket has allowed the attempt.
+    """
+
+    def __init__(self, backend, ip_burst: int, ip_per_minute: float, user_burst: int, user_per_minute: float):
+        self.backend = backend
+        self.limits = {
+            "ip": (ip_burst, ip_per_minute / 60),
+            "username": (user_burst, user_per_minute / 60),
+        }
+
+    async def check(self, request: Request, username: str):
+        # Behind nginx this is the proxy unless uvicorn/gunicorn trusts its
+        # X-Forwarded-For (--proxy-headers, --forwarded-allow-ips)
+        client_ip = request.client.host if request.client else "unknown"
+        keys = {"ip": f"ip:{client_ip}", "username": f"user:{username.strip().lower()}"}
+        for kind, key in keys.items():
+            capacity, rate = self.limits[kind]
+            wait = await self.backend.take(key, capacity, rate)
+            if wait > 0:
+                metrics.LOGIN_THROTTLED.labels(kind).inc()
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many login attempts, try again later",
+                    headers={"Retry-After": str(max(math.ceil(wait), 1))},
+                )
+
+    def clear(self):
+        self.backend.clear()
+
+
+def _make_backend(name: str):
+    if name == "memory":
+        return MemoryBackend(config.settings.login_throttle_max_keys)
+    if name == "postgres":
+        return PostgresBackend()
+    if name == "none":
+        return None
+    raise ValueError(f"unknown login_throttle_backend {name!r}, expected memory, postgres or none")
+
+
+# None when login_throttle_backend is "none"
+login_throttle: Optional[LoginThrottle] = None
+_backend = _make_backend(config.settings.login_throttle_backend)
+if _backend is not None:
+    login_throttle = LoginThrottle(
+        _backend,
+        ip_burst=config.settings.login_ip_burst,
+        ip_per_minute=config.settings.login_ip_per_minute,
+        user_burst=config.settings.login_user_burst,
+        user_per_minute=config.settings.login_user_per_minute,
+    )
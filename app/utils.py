@@ -1,10 +1,118 @@
 # utils.py
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from . import config, metrics
+
+# Pinning min and max to the configured cost makes verify_and_update() hand
+# back a new hash whenever a stored one was made with a different cost.
+_rounds = config.settings.bcrypt_rounds
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=_rounds,
+    bcrypt__min_rounds=_rounds,
+    bcrypt__max_rounds=_rounds,
+)
 
 def hash(password: str):
     return pwd_context.hash(password)
 
 def verify(plain_password: str, hashed_password: str):
-    return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+    return pwd_context.verify(plain_password, hashed_password)
+
+def verify_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+# ----------------- Hashing Pool -----------------
+# bcrypt is pure CPU and holds the GIL, so routers await these wrappers, which
+# run it in a separate process pool per worker. Jobs beyond HASH_QUEUE_LIMIT
+# are refused with a 503 instead of queueing behind a login burst.
+_executor: Optional[ProcessPoolExecutor] = None
+_pending = 0
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=config.settings.hash_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+def _drop_executor(broken: ProcessPoolExecutor):
+    # A pool whose process died refuses every later job; let the next call
+    # start a new one. Concurrent callers may already have replaced it.
+    global _executor
+    if _executor is broken:
+        _executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+async def _run_in_pool(fn, *args):
+    global _pending
+    if _pending >= config.settings.hash_queue_limit:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many password operations in progress, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+    _pending += 1
+    start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    try:
+        executor = _get_executor()
+        try:
+            return await loop.run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            # Retried once, on a fresh pool
+            _drop_executor(executor)
+            return await loop.run_in_executor(_get_executor(), fn, *args)
+    finally:
+        _pending -= 1
+        metrics.observe_hash(fn.__name__, time.perf_counter() - start)
+
+
+async def hash_async(password: str) -> str:
+    return await _run_in_pool(hash, password)
+
+
+async def verify_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_in_pool(verify, plain_password, hashed_password)
+
+
+async def verify_and_update_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return await _run_in_pool(verify_and_update, plain_password, hashed_password)
+
+
+def _load_backend():
+    # Runs in each pool process: loading passlib's bcrypt backend is the
+    # slow part of a process's first job
+    pwd_context.handler("bcrypt").get_backend()
+
+
+async def warm_pool():
+    """Start every hashing process now instead of on the first logins."""
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    # With none idle, each submission spawns another process
+    await asyncio.gather(*(
+        loop.run_in_executor(executor, _load_backend) for _ in range(config.settings.hash_workers)
+    ))
+
+
+def shutdown_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+
+from fastapi import FastAPI
+from sqlalchemy import select
+
+from app import config, database, models, schemas, serializers, utils
+from app.routers import auth, post
+
+logger = logging.getLogger(__name__)
+
+
+def _hot_statements():
+    """What the busiest routes execute, with values that match nothing.
+
+    SQLAlchemy caches compiled SQL by statement shape, not by bound values,
+    so running these once compiles exactly what the routes will look up.
+    """
+    page, sort_key, page_order, _ = post.listing_page(10, 0, None, "", "substring", "new", None)
+    return [
+        # /login
+        auth.user_by_email(""),
+        # GET /posts/{id} revalidation
+        post.post_version(0),
+        # GET /posts/ first page
+        post.listing_posts(page, sort_key, page_order, None),
+    ]
+
+
+async def _warm_session(replica: bool, connections: int):
+    # Each session checks out its own connection, so together they fill the
+    # pool up to `connections` before any request needs one
+    sessions = [database.open_session(replica=replica) for _ in range(max(connections, 1))]
+    try:
+        await asyncio.gather(*(db.execute(select(1)) for db in sessions))
+        db = sessions[0]
+        for statement in _hot_statements():
+            await db.execute(statement)
+        # session.get() and the user cache build their own statements
+        await db.get(models.User, 0)
+        await db.get(models.Post, 0)
+        await db.rollback()
+    finally:
+        await asyncio.gather(*(db.close() for db in sessions))
+
+
+def _warm_serializers():
+    now = datetime.now(timezone.utc)
+    sample = models.Post(
+        id=0, title="", content="", published=True, owner_id=0, votes_count=0, created_at=now, updated_at=now,
+    )
+    owner = schemas.UserOut(id=0, email="warmup@example.com", created_at=now)
+    serializers.render_posts([sample], {0: owner})
+    serializers.render_post(sample, owner)
+
+
+async def warm_up(app: FastAPI) -> dict:
+    """Do at startup what the first requests would otherwise pay for.
+
+    Returns the milliseconds each step took.
+    """
+    connections = min(config.settings.warmup_connections, config.settings.db_pool_size)
+    steps = [
+        ("database", lambda: _warm_session(False, connections)),
+        ("hash_pool", utils.warm_pool),
+    ]
+    if database.SQLALCHEMY_REPLICA_URL:
+        steps.insert(1, ("replica", lambda: _warm_session(True, connections)))
+
+    timings = {}
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            await step()
+        except Exception:
+            # A database that is still starting should not stop the app;
+            # requests will open connections as they always did
+            logger.exception("warm-up step %s failed", name)
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
+
+    start = time.perf_counter()
+    _warm_serializers()
+    app.openapi()
+    timings["schemas"] = round((time.perf_counter() - start) * 1000, 1)
+    return timings
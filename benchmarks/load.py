@@ -0,0 +1,285 @@
+"""Closed-loop load test of the API over HTTP.
+
+    python -m benchmarks.load [--mix browse] [--concurrency 16] [--duration 30]
+    python -m benchmarks.load --url http://127.0.0.1:8000 --mix write
+    python -m benchmarks.load --save-baseline benchmarks/baselines/browse.json
+    python -m benchmarks.load --baseline benchmarks/baselines/browse.json --tolerance 0.15
+
+Without --url the app is driven in-process through httpx's ASGI transport,
+against the database configured in the environment; with --url it hits a
+running uvicorn or gunicorn. Either way every request is a real round trip to
+Postgres, so load data first (python -m app.cli seed) for realistic plans.
+
+Each concurrent worker is one user registered at start-up; it picks its next
+request from the mix's weights and sends it as soon as the previous one is
+answered. In-process numbers include the client's own overhead on the same
+event loop and are only comparable with other in-process runs. Past its
+limits the login throttle answers logins with 429, so run the server with
+LOGIN_THROTTLE_BACKEND=none for mixes that log in often.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+
+from app.seed import WORDS
+
+
+# Relative weights of each operation
+MIXES = {
+    "browse": {"list": 40, "search": 15, "get": 35, "create": 3, "vote": 5, "login": 2},
+    "write": {"list": 20, "search": 5, "get": 20, "create": 25, "vote": 25, "login": 5},
+    "search": {"list": 20, "search": 70, "get": 10},
+    "login": {"login": 100},
+}
+
+# Throughput may drop, and these percentiles and the error rate rise, by at
+# most the tolerance; against a baseline without errors, any error fails
+COMPARED_PERCENTILES = ("p95", "p99")
+
+
+class Worker:
+    """One benchmark user: its token, the posts it knows of and its votes."""
+
+    def __init__(self, client: httpx.AsyncClient, email: str, password: str, rng: random.Random):
+        self.client = client
+        self.email = email
+        self.password = password
+        self.rng = rng
+        self.headers = {}
+        self.post_ids: List[int] = []
+        self.voted = set()
+
+    async def register(self):
+        res = await self.client.post("/users/", json={"email": self.email, "password": self.password})
+        res.raise_for_status()
+        res = await self.login()
+        res.raise_for_status()
+
+    # ----------------- Operations -----------------
+    # Each returns the response; a status outside EXPECTED counts as an error
+    async def login(self):
+        res = await self.client.post("/login", data={"username": self.email, "password": self.password})
+        if res.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {res.json()['access_token']}"}
+        return res
+
+    async def list(self):
+        sort = self.rng.choice(("new", "new", "votes", "top"))
+        return await self.client.get("/posts/", params={"limit": 20, "sort": sort}, headers=self.headers)
+
+    async def search(self):
+        params = {"limit": 20, "search": self.rng.choice(WORDS)}
+        if self.rng.random() < 0.5:
+            params["mode"] = "fts"
+        return await self.client.get("/posts/", params=params, headers=self.headers)
+
+    async def get(self):
+        return await self.client.get(f"/posts/{self.rng.choice(self.post_ids)}", headers=self.headers)
+
+    async def create(self):
+        words = self.rng.choices(WORDS, k=40)
+        res = await self.client.post(
+            "/posts/", json={"title": " ".join(words[:6]), "content": " ".join(words)}, headers=self.headers,
+        )
+        if res.status_code == 201:
+            self.post_ids.append(res.json()["Post"]["id"])
+        return res
+
+    async def vote(self):
+        # Toggle, so each vote is accepted rather than answered with a 409
+        post_id = self.rng.choice(self.post_ids)
+        voted = post_id in self.voted
+        res = await self.client.post("/vote/", json={"post_id": post_id, "dir": 0 if voted else 1}, headers=self.headers)
+        if res.status_code == 201:
+            self.voted.symmetric_difference_update({post_id})
+        return res
+
+
+EXPECTED = {"login": {200}, "list": {200}, "search": {200}, "get": {200}, "create": {201}, "vote": {201}}
+
+
+# ----------------- Statistics -----------------
+def summarize(samples: Dict[str, List[float]], errors: Dict[str, int], elapsed: float) -> dict:
+    """Throughput and latency percentiles (ms) overall and per operation."""
+    def latency(values):
+        if not values:
+            return {"p50": None, "p95": None, "p99": None}
+        p50, p95, p99 = np.percentile(np.asarray(values) * 1000, [50, 95, 99])
+        return {"p50": round(float(p50), 2), "p95": round(float(p95), 2), "p99": round(float(p99), 2)}
+
+    every = [value for values in samples.values() for value in values]
+    return {
+        "requests": len(every),
+        "errors": sum(errors.values()),
+        "seconds": round(elapsed, 2),
+        "throughput": round(len(every) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": latency(every),
+        "operations": {
+            op: {"requests": len(values), "errors": errors.get(op, 0), "latency_ms": latency(values)}
+            for op, values in sorted(samples.items())
+        },
+    }
+
+
+def _error_rate(stats: dict) -> float:
+    return stats["errors"] / stats["requests"] if stats["requests"] else 0.0
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Regressions of report against baseline, as readable lines."""
+    regressions = []
+    if report["throughput"] < baseline["throughput"] * (1 - tolerance):
+        regressions.append(f"throughput {report['throughput']} req/s, baseline {baseline['throughput']}")
+
+    # Failing fast (429s, 500s) makes latency look better, so errors are
+    # checked along with it
+    def check(name, current, previous):
+        now, before = _error_rate(current), _error_rate(previous)
+        if now > before * (1 + tolerance):
+            regressions.append(f"{name} errors {now:.2%}, baseline {before:.2%}")
+        for key in COMPARED_PERCENTILES:
+            now, before = current["latency_ms"].get(key), previous["latency_ms"].get(key)
+            if now is not None and before and now > before * (1 + tolerance):
+                regressions.append(f"{name} {key} {now} ms, baseline {before}")
+
+    check("all", report, baseline)
+    for op, stats in report["operations"].items():
+        if op in baseline.get("operations", {}):
+            check(op, stats, baseline["operations"][op])
+    return regressions
+
+
+def print_report(report: dict):
+    print(f"{report['requests']} requests in {report['seconds']}s, {report['throughput']} req/s, {report['errors']} errors")
+    print(f"{'operation':<10}{'requests':>10}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    rows = list(report["operations"].items()) + [("all", report)]
+    for op, stats in rows:
+        latency = stats["latency_ms"]
+        print(f"{op:<10}{stats['requests']:>10}{stats['errors']:>8}"
+              + "".join(f"{latency[key] if latency[key] is not None else '-':>10}" for key in ("p50", "p95", "p99")))
+
+
+# ----------------- Runner -----------------
+@asynccontextmanager
+async def open_client(url: Optional[str], concurrency: int):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    if url:
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+            yield client
+        return
+
+    # Imported here so --url runs do not create engines they never use
+    from app.main import create_app
+
+    app = create_app()
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            yield client
+
+
+async def prepare(client: httpx.AsyncClient, concurrency: int, seed: int) -> List[Worker]:
+    run_id = uuid.uuid4().hex[:8]
+    workers = [
+        Worker(client, f"bench-{run_id}-{i}@example.com", "bench-password", random.Random(seed + i))
+        for i in range(concurrency)
+    ]
+    await asyncio.gather(*(worker.register() for worker in workers))
+
+    res = await client.get("/posts/", params={"limit": 200, "sort": "votes"}, headers=workers[0].headers)
+    res.raise_for_status()
+    post_ids = [post["Post"]["id"] for post in res.json()]
+    if not post_ids:
+        for worker in workers:
+            res = await worker.create()
+            res.raise_for_status()
+        post_ids = [worker.post_ids[0] for worker in workers]
+    for worker in workers:
+        worker.post_ids = list(post_ids)
+    return workers
+
+
+async def drive(workers: List[Worker], mix: Dict[str, int], duration: float, warmup: float) -> dict:
+    samples = {op: [] for op in mix}
+    errors = {op: 0 for op in mix}
+    ops, weights = list(mix), list(mix.values())
+    start = time.perf_counter()
+    measure_from = start + warmup
+    deadline = measure_from + duration
+
+    async def loop(worker: Worker):
+        while True:
+            sent = time.perf_counter()
+            if sent >= deadline:
+                return
+            op = worker.rng.choices(ops, weights)[0]
+            try:
+                res = await getattr(worker, op)()
+                ok = res.status_code in EXPECTED[op]
+            except httpx.HTTPError:
+                ok = False
+            if sent >= measure_from:
+                samples[op].append(time.perf_counter() - sent)
+                if not ok:
+                    errors[op] += 1
+
+    await asyncio.gather(*(loop(worker) for worker in workers))
+    return summarize(samples, errors, time.perf_counter() - measure_from)
+
+
+async def run(args) -> int:
+    async with open_client(args.url, args.concurrency) as client:
+        workers = await prepare(client, args.concurrency, args.seed)
+        report = await drive(workers, MIXES[args.mix], args.duration, args.warmup)
+
+    report = {
+        "mix": args.mix, "target": args.url or "in-process", "concurrency": args.concurrency, **report,
+    }
+    print_report(report)
+
+    if args.save_baseline:
+        path = Path(args.save_baseline)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"baseline saved to {path}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        if (baseline["mix"], baseline["concurrency"]) != (report["mix"], report["concurrency"]):
+            print("warning: baseline was recorded with a different mix or concurrency", file=sys.stderr)
+        regressions = compare(report, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print(f"within {args.tolerance:.0%} of baseline")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load")
+    parser.add_argument("--url", help="base URL of a running server; in-process when omitted")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="browse")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent users")
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="unmeasured seconds before that")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save-baseline", metavar="PATH", help="write the report as JSON")
+    parser.add_argument("--baseline", metavar="PATH", help="compare against a saved report")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative regression")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Per-post cost of rendering a GET /posts/ page, before and after app.serializers.
+
+    python -m benchmarks.serialize_posts [--posts 100] [--repeat 200]
+
+Needs the usual settings in the environment (or .env) to import the app but
+does not touch the database: the posts are transient ORM objects.
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+from typing import List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from app import models, schemas, serializers
+
+
+def make_posts(count: int):
+    now = datetime.now(timezone.utc)
+    owner = schemas.UserOut(id=1, email="owner@example.com", created_at=now)
+    posts = [
+        models.Post(
+            id=i, title=f"Post {i}", content="lorem ipsum " * 20, published=True,
+            owner_id=1, votes_count=i % 50, created_at=now, updated_at=now,
+        )
+        for i in range(count)
+    ]
+    return posts, {1: owner}
+
+
+# The previous path: copy __dict__ into a dict per post, validate PostSchema,
+# then FastAPI validates and serializes again through response_model
+response_field = create_model_field(name="response", type_=List[schemas.PostOut], mode="serialization")
+
+
+async def render_before(posts, owners) -> bytes:
+    content = [
+        {"Post": schemas.PostSchema.model_validate({
+            **post.__dict__,
+            "owner": owners[post.owner_id]
+        }), "votes": post.votes_count}
+        for post in posts
+    ]
+    serialized = await serialize_response(field=response_field, response_content=content, is_coroutine=True)
+    return JSONResponse(serialized).body
+
+
+async def render_after(posts, owners) -> bytes:
+    return serializers.render_posts(posts, owners).body
+
+
+async def measure(render, posts, owners, repeat: int) -> float:
+    await render(posts, owners)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await render(posts, owners)
+    return (time.perf_counter() - start) / (repeat * len(posts))
+
+
+async def run(count: int, repeat: int):
+    posts, owners = make_posts(count)
+    assert json.loads(await render_before(posts, owners)) == json.loads(await render_after(posts, owners))
+
+    before = await measure(render_before, posts, owners, repeat)
+    after = await measure(render_after, posts, owners, repeat)
+    print(f"{count} posts x {repeat} pages")
+    print(f"before: {before * 1e6:8.2f} us/post")
+    print(f"after:  {after * 1e6:8.2f} us/post  ({before / after:.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.serialize_posts")
+    parser.add_argument("--posts", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.posts, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Per-execution CPU of the hot statements, before and after lambda_stmt.
+
+    python -m benchmarks.sql_cache [--repeat 2000]
+
+Times what SQLAlchemy does for one Session.execute(): building the
+statement, computing its cache key and either finding the compiled form in
+the cache or compiling it again, then binding parameters. The execution is
+stopped just before the cursor is used, so the database and the network are
+left out and nothing is written. Needs the usual settings in the environment
+(or .env) and a reachable database for the one pooled connection.
+"""
+import argparse
+import time
+
+from sqlalchemy import delete, event, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app import models, throttle
+from app.database import engine
+from app.routers import auth, post, vote
+
+
+class _Stop(Exception):
+    pass
+
+
+def _stop(*args):
+    raise _Stop
+
+
+# The previous constructions, rebuilt on every request
+def add_vote_before(post_id, user_id):
+    inserted = (
+        insert(models.Vote)
+        .values(post_id=post_id, user_id=user_id)
+        .on_conflict_do_nothing()
+        .returning(models.Vote.post_id)
+        .cte("inserted")
+    )
+    return vote._bump_votes_count(inserted, 1)
+
+
+def remove_vote_before(post_id, user_id):
+    deleted = (
+        delete(models.Vote)
+        .where(models.Vote.post_id == post_id, models.Vote.user_id == user_id)
+        .returning(models.Vote.post_id)
+        .cte("deleted")
+    )
+    return vote._bump_votes_count(deleted, -1)
+
+
+def add_votes_before(post_ids, user_id):
+    return (
+        insert(models.Vote)
+        .values([{"post_id": post_id, "user_id": user_id} for post_id in post_ids])
+        .on_conflict_do_nothing()
+        .returning(models.Vote.post_id)
+    )
+
+
+def take_token_before(key, capacity, rate):
+    table = models.LoginThrottle
+    refilled = func.least(
+        capacity, table.tokens + func.extract("epoch", func.clock_timestamp() - table.updated_at) * rate
+    )
+    stmt = insert(table).values(key=key, tokens=capacity - 1, updated_at=func.clock_timestamp())
+    return stmt.on_conflict_do_update(
+        index_elements=[table.key],
+        set_={"tokens": refilled - 1, "updated_at": func.clock_timestamp()},
+        where=refilled >= 1,
+    ).returning(table.key)
+
+
+throttle_params = {"key": "ip:10.0.0.1", "capacity": 20.0, "rate": 1 / 6}
+batch = list(range(1, 21))
+
+# name -> (before, after); each is a callable returning (statement, params)
+CASES = {
+    "login lookup": (
+        lambda i: (select(models.User).where(models.User.email == f"user{i}@example.com"), None),
+        lambda i: (auth.user_by_email(f"user{i}@example.com"), None),
+    ),
+    "post revalidation": (
+        lambda i: (select(models.Post.updated_at).where(models.Post.id == i), None),
+        lambda i: (post.post_version(i), None),
+    ),
+    "add vote": (
+        lambda i: (add_vote_before(i, 1), None),
+        lambda i: (vote._add_vote(i, 1), None),
+    ),
+    "remove vote": (
+        lambda i: (remove_vote_before(i, 1), None),
+        lambda i: (vote._remove_vote(i, 1), None),
+    ),
+    "batch of 20 votes": (
+        lambda i: (add_votes_before(batch, i), None),
+        lambda i: (vote._add_votes, {"post_ids": batch, "user_id": i}),
+    ),
+    "throttle upsert": (
+        lambda i: (take_token_before(**throttle_params), None),
+        lambda i: (throttle._take_token, throttle_params),
+    ),
+}
+
+
+def measure(db: Session, make, repeat: int) -> float:
+    def run(i):
+        try:
+            statement, params = make(i)
+            db.execute(statement, params)
+        except _Stop:
+            pass
+
+    for i in range(10):
+        run(i)
+    start = time.perf_counter()
+    for i in range(repeat):
+        run(i)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.sql_cache")
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    with Session(engine) as db:
+        db.execute(select(1))  # check out the connection before timing
+        event.listen(engine, "before_cursor_execute", _stop)
+        try:
+            print(f"{'statement':<20}{'before us':>12}{'after us':>12}{'saved us':>12}")
+            for name, (before, after) in CASES.items():
+                old = measure(db, before, args.repeat) * 1e6
+                new = measure(db, after, args.repeat) * 1e6
+                print(f"{name:<20}{old:>12.1f}{new:>12.1f}{old - new:>12.1f}")
+        finally:
+            event.remove(engine, "before_cursor_execute", _stop)
+
+
+if __name__ == "__main__":
+    main()
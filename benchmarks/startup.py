@@ -0,0 +1,174 @@
+"""Import time and time to first response, with and without the warm-up.
+
+    python -m benchmarks.startup [--repeat 5] [--top 10]
+    python -m benchmarks.startup --save-baseline benchmarks/baselines/startup.json
+    python -m benchmarks.startup --baseline benchmarks/baselines/startup.json --tolerance 0.2
+
+Import time is measured in fresh interpreters, so it includes every module
+app.main pulls in; --top lists the slowest of them from -X importtime.
+
+For the first responses a uvicorn is started on a free port, once with
+WARMUP=true and once with WARMUP=false. After GET / first succeeds, a fixed
+sequence (a post lookup, sign-up, login, the first listing page) is sent
+twice; the first pass is what a fresh worker's first users wait, the second
+is the steady state. Sign-up registers a throwaway user in the configured
+database.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+
+IMPORT_SNIPPET = "import time; s = time.perf_counter(); import app.main; print(time.perf_counter() - s)"
+READY_TIMEOUT = 60
+
+
+# ----------------- Import Time -----------------
+def import_seconds(repeat: int) -> float:
+    runs = [
+        float(subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], capture_output=True, text=True, check=True).stdout)
+        for _ in range(repeat)
+    ]
+    return statistics.median(runs)
+
+
+def slowest_imports(top: int) -> List[tuple]:
+    """(self ms, cumulative ms, module) of the modules slowest to import themselves."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"], capture_output=True, text=True, check=True
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, module = (part.strip() for part in line[len("import time:"):].split("|"))
+        rows.append((int(own) / 1000, int(cumulative) / 1000, module))
+    return sorted(rows, reverse=True)[:top]
+
+
+# ----------------- First Responses -----------------
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _first_pass(client: httpx.Client, email: str, sign_up: bool) -> Dict[str, float]:
+    timings = {}
+
+    def timed(name, method, url, **kwargs):
+        start = time.perf_counter()
+        res = client.request(method, url, **kwargs)
+        timings[name] = round((time.perf_counter() - start) * 1000, 1)
+        return res
+
+    timed("get_post", "GET", "/posts/0")
+    if sign_up:
+        timed("sign_up", "POST", "/users/", json={"email": email, "password": "startup-password"})
+    res = timed("login", "POST", "/login", data={"username": email, "password": "startup-password"})
+    res.raise_for_status()
+    headers = {"Authorization": f"Bearer {res.json()['access_token']}"}
+    timed("list_posts", "GET", "/posts/", headers=headers)
+    return timings
+
+
+def first_responses(warmup: bool) -> dict:
+    port = _free_port()
+    env = {**os.environ, "WARMUP": str(warmup).lower()}
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=60) as client:
+            while True:
+                if time.perf_counter() - started > READY_TIMEOUT or server.poll() is not None:
+                    raise RuntimeError("uvicorn did not start; run it by hand to see why")
+                try:
+                    client.get("/")
+                    break
+                except httpx.TransportError:
+                    time.sleep(0.02)
+            ready = time.perf_counter() - started
+
+            email = f"startup-{uuid.uuid4().hex[:8]}@example.com"
+            first = _first_pass(client, email, sign_up=True)
+            second = _first_pass(client, email, sign_up=False)
+    finally:
+        server.terminate()
+        server.wait()
+    return {"ready_ms": round(ready * 1000, 1), "first_ms": first, "repeat_ms": second}
+
+
+# ----------------- Baselines -----------------
+def _flatten(report: dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in report.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Timings that grew by more than the tolerance; every number here is a time."""
+    current, previous = _flatten(report), _flatten(baseline)
+    return [
+        f"{name} {value}, baseline {previous[name]}"
+        for name, value in current.items()
+        if previous.get(name) and value > previous[name] * (1 + tolerance)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters for the import time")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write the report as JSON")
+    parser.add_argument("--baseline", metavar="PATH", help="compare against a saved report")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    report = {"import_ms": round(import_seconds(args.repeat) * 1000, 1)}
+    print(f"import app.main: {report['import_ms']} ms (median of {args.repeat})")
+    for own, cumulative, module in slowest_imports(args.top):
+        print(f"  {own:8.1f} ms self {cumulative:8.1f} ms total  {module}")
+
+    for warmup in (True, False):
+        name = "warmup" if warmup else "no_warmup"
+        report[name] = first_responses(warmup)
+        result = report[name]
+        print(f"{name}: ready after {result['ready_ms']} ms")
+        for step, first in result["first_ms"].items():
+            repeat = result["repeat_ms"].get(step)
+            print(f"  {step:<12}{first:>10} ms first" + (f"{repeat:>10} ms after" if repeat is not None else ""))
+
+    if args.save_baseline:
+        path = Path(args.save_baseline)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"baseline saved to {path}")
+
+    if args.baseline:
+        regressions = compare(report, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"within {args.tolerance:.0%} of baseline")
+
+
+if __name__ == "__main__":
+    main()
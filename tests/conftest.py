@@ -1,11 +1,16 @@
+import asyncio
 from fastapi.testclient import TestClient
 import pytest
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from app.main import app
-from app.database import get_db, Base
+from app.database import get_db, get_read_db, Base, ThreadedSession
 from app.config import settings
-from app import models
+from app.cache import user_cache
+from app.throttle import login_throttle
+from app import database, models
 from jose import jwt
 from app.oauth2 import create_access_token  # if needed
 
@@ -26,6 +31,12 @@ def session():
     # Drop and recreate all tables for a clean slate before each test session
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
+    # ids are reused once the tables are recreated
+    user_cache.clear()
+    if login_throttle is not None:
+        login_throttle.clear()
+    # the shared profiling switches went with the tables; re-read them
+    database.profiling.next_refresh = 0
 
     db = TestingSessionLocal()
     try:
@@ -34,16 +45,45 @@ def session():
         db.close()
 
 
-# Test client with overridden dependency
+def loop_safe_async_engine():
+    # Every asyncio.run() and every TestClient request without a `with` block
+    # runs on its own event loop, and a pooled asyncpg connection cannot be
+    # used from another loop; without a pool each session connects afresh
+    return create_async_engine(
+        SQLALCHEMY_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1),
+        poolclass=NullPool,
+        connect_args=database._connect_args(is_async=True),
+    )
+
+
+# The engine database.open_session() uses in the current mode, for tests that
+# reach it rather than the overridden dependencies. With DATABASE_ASYNC on,
+# it is swapped for a loop-safe one.
+@pytest.fixture()
+def primary_engine(monkeypatch):
+    if database.AsyncSessionLocal is None:
+        yield database.engine
+        return
+    async_engine = loop_safe_async_engine()
+    monkeypatch.setattr(
+        database, "AsyncSessionLocal", async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    )
+    yield async_engine.sync_engine
+    asyncio.run(async_engine.dispose())
+
+
+# Test client with overridden dependency. Code that opens its own session,
+# like the export stream, still goes through primary_engine.
 @pytest.fixture()
-def client(session):
+def client(session, primary_engine):
     def override_get_db():
         try:
-            yield session
+            yield ThreadedSession(session)
         finally:
             pass  # session managed by fixture
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
     yield TestClient(app)
     app.dependency_overrides.clear()
 
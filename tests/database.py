@@ -3,8 +3,9 @@ import pytest
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from app.main import app
-from app.database import get_db, Base
+from app.database import get_db, get_read_db, Base, ThreadedSession
 from app.config import settings
+from app.cache import user_cache
 
 # Create test database engine and session
 SQLALCHEMY_DATABASE_URL = (
@@ -22,6 +23,8 @@ def session():
     # Drop and recreate all tables for a clean slate
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
+    # ids are reused once the tables are recreated
+    user_cache.clear()
 
     db = TestingSessionLocal()
     try:
@@ -36,10 +39,11 @@ def client(session):
     # Dependency override
     def override_get_db():
         try:
-            yield session
+            yield ThreadedSession(session)
         finally:
             pass  # session is handled by the outer fixture
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
     yield TestClient(app)
     app.dependency_overrides.clear()  # clean up overrides after test
\ No newline at end of file
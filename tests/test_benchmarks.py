@@ -0,0 +1,35 @@
+from benchmarks.load import compare, summarize
+
+
+def test_summarize_percentiles():
+    samples = {"get": [i / 1000 for i in range(1, 101)], "vote": []}
+    report = summarize(samples, {"get": 2}, elapsed=10)
+    assert report["requests"] == 100
+    assert report["errors"] == 2
+    assert report["throughput"] == 10.0
+    assert report["operations"]["get"]["latency_ms"]["p50"] == 50.5
+    assert report["operations"]["vote"]["latency_ms"]["p99"] is None
+
+
+def test_compare_flags_regressions_beyond_tolerance():
+    baseline = summarize({"get": [0.010] * 100}, {}, elapsed=1)
+    within = summarize({"get": [0.0105] * 95}, {}, elapsed=1)
+    assert compare(within, baseline, tolerance=0.1) == []
+
+    slower = summarize({"get": [0.020] * 50}, {}, elapsed=1)
+    regressions = compare(slower, baseline, tolerance=0.1)
+    assert any(line.startswith("throughput") for line in regressions)
+    assert any(line.startswith("get p95") for line in regressions)
+
+
+def test_compare_flags_errors():
+    baseline = summarize({"get": [0.010] * 100}, {}, elapsed=1)
+    # failing fast looks quicker, but is still a regression
+    failing = summarize({"get": [0.005] * 100}, {"get": 20}, elapsed=1)
+    regressions = compare(failing, baseline, tolerance=0.1)
+    assert "all errors 20.00%, baseline 0.00%" in regressions
+    assert "get errors 20.00%, baseline 0.00%" in regressions
+
+    # as many errors as the baseline had is fine
+    with_errors = summarize({"get": [0.010] * 100}, {"get": 10}, elapsed=1)
+    assert compare(with_errors, with_errors, tolerance=0.1) == []
@@ -0,0 +1,112 @@
+import gzip
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app import models
+from app.compression import CompressionMiddleware, negotiate
+
+
+@pytest.fixture()
+def long_posts(test_user, session):
+    posts = [
+        models.Post(title=f"Long post {i}", content="lorem ipsum dolor sit amet " * 100, owner_id=test_user["id"])
+        for i in range(5)
+    ]
+    session.add_all(posts)
+    session.commit()
+    return posts
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("gzip, deflate, br", "br"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("br;q=0, gzip;q=0", None),
+    ("*", "br"),
+    ("*;q=0.1, br;q=0", "gzip"),
+    ("GZIP;q=0.8", "gzip"),
+])
+def test_negotiate(header, expected):
+    assert negotiate(header) == expected
+
+
+@pytest.mark.parametrize("encoding", ["br", "gzip"])
+def test_listing_is_compressed(client, test_user, long_posts, encoding):
+    headers = {"Authorization": f"Bearer {test_user['token']}", "Accept-Encoding": encoding}
+    res = client.get("/posts/", headers=headers)
+    assert res.status_code == 200
+    assert res.headers["content-encoding"] == encoding
+    assert "Accept-Encoding" in res.headers["vary"]
+    assert len(res.json()) == len(long_posts)
+    etag = res.headers["etag"]
+    assert etag.startswith("W/")
+
+    res = client.get("/posts/", headers={**headers, "If-None-Match": etag})
+    assert res.status_code == 304
+    assert res.headers["etag"] == etag
+    assert "Accept-Encoding" in res.headers["vary"]
+
+
+def test_identity_when_not_accepted(client, test_user, long_posts):
+    headers = {"Authorization": f"Bearer {test_user['token']}", "Accept-Encoding": "identity"}
+    res = client.get("/posts/", headers=headers)
+    assert "content-encoding" not in res.headers
+    assert not res.headers["etag"].startswith("W/")
+
+
+def test_small_response_is_not_compressed(client):
+    res = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert res.status_code == 200
+    assert "content-encoding" not in res.headers
+    assert "Accept-Encoding" in res.headers["vary"]
+
+
+def test_export_is_compressed_per_chunk(client, test_user, long_posts):
+    headers = {"Authorization": f"Bearer {test_user['token']}", "Accept-Encoding": "gzip"}
+    with client.stream("GET", "/posts/export", headers=headers) as res:
+        assert res.headers["content-encoding"] == "gzip"
+        assert "content-length" not in res.headers
+        raw = b"".join(res.iter_raw())
+    rows = [json.loads(line) for line in gzip.decompress(raw).decode().splitlines()]
+    assert [row["title"] for row in rows] == [post.title for post in long_posts]
+
+
+def test_bypassed_responses():
+    app = FastAPI()
+    body = "x" * 4096
+
+    @app.get("/events")
+    def events():
+        return StreamingResponse(iter([body, body]), media_type="text/event-stream")
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse(iter([body, body]), media_type="text/plain")
+
+    @app.get("/no-transform")
+    def no_transform():
+        return PlainTextResponse(body, headers={"Cache-Control": "no-transform"})
+
+    @app.get("/text")
+    def text():
+        return PlainTextResponse(body)
+
+    app.add_middleware(CompressionMiddleware, minimum_size=100, gzip_level=6, brotli_quality=4, streaming=False)
+    client = TestClient(app, headers={"Accept-Encoding": "gzip"})
+
+    for path in ("/events", "/stream", "/no-transform"):
+        res = client.get(path)
+        assert "content-encoding" not in res.headers, path
+        assert res.text.startswith(body)
+    assert client.head("/text").headers.get("content-encoding") is None
+
+    res = client.get("/text")
+    assert res.headers["content-encoding"] == "gzip"
+    assert int(res.headers["content-length"]) < len(body)
+    assert res.text == body
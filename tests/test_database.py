@@ -0,0 +1,237 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from app import database
+from app.database import QueryCounter
+from app.config import settings
+from app.oauth2 import create_access_token
+from tests.conftest import loop_safe_async_engine
+
+
+def test_metered_pool_counts_waits_and_timeouts():
+    engine = create_engine(
+        database.SQLALCHEMY_DATABASE_URL,
+        poolclass=database.MeteredQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.1,
+    )
+    try:
+        held = engine.connect()
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+        held.close()
+
+        metrics = engine.pool.metrics
+        assert metrics.checkouts == 2
+        assert metrics.timeouts == 1
+        assert metrics.wait_max >= 0.1
+    finally:
+        engine.dispose()
+
+
+def test_statement_timeout_setting(monkeypatch):
+    monkeypatch.setattr(settings, "db_statement_timeout_ms", 1500)
+    engine = create_engine(database.SQLALCHEMY_DATABASE_URL, connect_args=database._connect_args(is_async=False))
+    try:
+        with engine.connect() as conn:
+            assert conn.execute(text("SHOW statement_timeout")).scalar() == "1500ms"
+    finally:
+        engine.dispose()
+
+
+def test_pool_stats_endpoint(client):
+    res = client.get("/stats/pool")
+    assert res.status_code == 200
+    sync_pool = res.json()["engines"]["sync"]
+    assert sync_pool["size"] == settings.db_pool_size
+    assert {"checked_out", "overflow", "wait_avg_ms", "timeouts"} <= sync_pool.keys()
+    assert res.json()["threadpool"]["limit"] > 0
+
+
+@pytest.fixture()
+def replica_engine(primary_engine, session, monkeypatch):
+    # the same DSN is enough to tell the two engines apart
+    monkeypatch.setattr(database, "write_log", database.PostgresWriteLog())
+    if database.AsyncSessionLocal is None:
+        replica = create_engine(database.SQLALCHEMY_DATABASE_URL)
+        monkeypatch.setattr(database, "ReplicaSessionLocal", sessionmaker(bind=replica))
+        yield replica
+        replica.dispose()
+        return
+    replica = loop_safe_async_engine()
+    monkeypatch.setattr(
+        database, "AsyncReplicaSessionLocal", async_sessionmaker(replica, autoflush=False, expire_on_commit=False)
+    )
+    yield replica.sync_engine
+    asyncio.run(replica.dispose())
+
+
+def _record_write(user_id):
+    async def record():
+        db = database.open_session()
+        await database.record_write(db, user_id)
+        await db.commit()
+        await db.close()
+    asyncio.run(record())
+
+
+def _read_engine(token):
+    async def open_read_session():
+        dependency = database.get_read_db(token)
+        db = await dependency.__anext__()
+        # AsyncSession and ThreadedSession both wrap a sync Session
+        bind = db.sync_session.get_bind()
+        await dependency.aclose()
+        return bind
+    return asyncio.run(open_read_session())
+
+
+def test_reads_go_to_replica(replica_engine):
+    assert _read_engine(None) is replica_engine
+    assert _read_engine(create_access_token({"user_id": 1})) is replica_engine
+
+
+@pytest.mark.parametrize("backend", ["postgres", "memory"])
+def test_read_your_writes_window(primary_engine, replica_engine, monkeypatch, backend):
+    monkeypatch.setattr(database, "write_log", database._make_write_log(backend))
+    token = create_access_token({"user_id": 1})
+    _record_write(1)
+    assert _read_engine(token) is primary_engine
+    # other users are unaffected
+    assert _read_engine(create_access_token({"user_id": 2})) is replica_engine
+
+    monkeypatch.setattr(settings, "read_your_writes_seconds", -1)
+    _record_write(1)
+    assert _read_engine(token) is replica_engine
+
+
+# Run in another worker process, with its own replica engine in the same mode
+RECORD_WRITE_SCRIPT = """
+import asyncio
+from app import database
+
+async def main():
+    db = database.open_session()
+    await database.record_write(db, 7)
+    await db.commit()
+    await db.close()
+    await database.dispose_engines()
+
+asyncio.run(main())
+"""
+
+
+def test_read_your_writes_across_workers(primary_engine, replica_engine):
+    env = {**os.environ, "DATABASE_REPLICA_HOST": settings.database_host, "READ_YOUR_WRITES_BACKEND": "postgres"}
+    subprocess.run([sys.executable, "-c", RECORD_WRITE_SCRIPT], env=env, check=True)
+
+    assert _read_engine(create_access_token({"user_id": 7})) is primary_engine
+    assert _read_engine(create_access_token({"user_id": 8})) is replica_engine
+
+
+ADMIN_HEADERS = {"X-Admin-Token": "operator-secret"}
+
+
+@pytest.fixture()
+def profiling(monkeypatch):
+    monkeypatch.setattr(settings, "admin_token", ADMIN_HEADERS["X-Admin-Token"])
+    saved = database.profiling.as_dict()
+    yield database.profiling
+    for key, value in saved.items():
+        setattr(database.profiling, key, value)
+
+
+def test_server_timing_header(client, test_user, test_posts, profiling):
+    headers = {"Authorization": f"Bearer {test_user['token']}"}
+    assert "server-timing" not in client.get("/posts/", headers=headers).headers
+
+    res = client.put("/stats/profiling", json={"enabled": True}, headers=ADMIN_HEADERS)
+    assert res.json()["enabled"] is True
+    timing = client.get("/posts/", headers=headers).headers["server-timing"]
+    assert timing.startswith('db;dur=') and 'queries"' in timing and "db-slowest;dur=" in timing
+
+
+def test_update_profiling_requires_admin_token(client, test_user, profiling, monkeypatch):
+    assert client.put("/stats/profiling", json={"enabled": True}).status_code == 401
+    # signing up is open to anyone, so a user's token is not enough
+    user_headers = {"Authorization": f"Bearer {test_user['token']}"}
+    assert client.put("/stats/profiling", json={"enabled": True}, headers=user_headers).status_code == 401
+    assert client.put("/stats/profiling", json={"enabled": True}, headers={"X-Admin-Token": "guess"}).status_code == 401
+    assert profiling.enabled is False
+
+    monkeypatch.setattr(settings, "admin_token", None)
+    res = client.put("/stats/profiling", json={"enabled": True}, headers=ADMIN_HEADERS)
+    assert res.status_code == 403
+    assert profiling.enabled is False
+
+
+def test_slow_query_log_with_explain(client, test_posts, profiling, caplog):
+    asyncio.run(profiling.update(enabled=True, slow_query_ms=0, explain_sample_rate=1))
+    with caplog.at_level("WARNING", logger="app.slow_queries"):
+        client.get(f"/posts/{test_posts[0].id}")
+    entry = json.loads(caplog.records[-1].getMessage())
+    assert entry["request"] == f"GET /posts/{test_posts[0].id}"
+    assert entry["queries"] >= 1
+    assert entry["statement"].startswith("SELECT")
+    assert "Execution Time" in entry["plan"]
+
+
+# Run in another worker process
+SET_PROFILING_SCRIPT = """
+import asyncio
+from app import database
+
+async def main():
+    await database.profiling.update(enabled=True, slow_query_ms=250)
+    await database.dispose_engines()
+
+asyncio.run(main())
+"""
+
+
+def test_profiling_switches_shared_across_workers(client, test_posts, profiling):
+    assert "server-timing" not in client.get("/posts/0").headers
+    subprocess.run([sys.executable, "-c", SET_PROFILING_SCRIPT], check=True)
+
+    # this worker follows once its copy is due for a refresh
+    profiling.next_refresh = 0
+    assert "server-timing" in client.get(f"/posts/{test_posts[0].id}").headers
+    assert client.get("/stats/profiling").json() == {
+        "enabled": True, "slow_query_ms": 250, "explain_sample_rate": settings.explain_sample_rate,
+    }
+
+    res = client.put("/stats/profiling", json={"enabled": False}, headers=ADMIN_HEADERS)
+    assert res.json()["enabled"] is False and res.json()["slow_query_ms"] == 250
+
+
+def test_hot_statements_hit_compiled_cache(client, test_user, test_posts):
+    headers = {"Authorization": f"Bearer {test_user['token']}"}
+    post_ids = [post.id for post in test_posts]
+
+    def hot_requests(batch_size):
+        for dir in (1, 0):
+            assert client.post("/vote/", json={"post_id": post_ids[0], "dir": dir}, headers=headers).status_code == 201
+        assert client.post("/vote/", json={"post_id": 9999, "dir": 0}, headers=headers).status_code == 404
+        batch = [{"post_id": post_id, "dir": 1} for post_id in post_ids[-batch_size:]]
+        assert client.post("/vote/batch", json=batch, headers=headers).status_code == 200
+        etag = client.get(f"/posts/{post_ids[1]}").headers["etag"]
+        assert client.get(f"/posts/{post_ids[1]}", headers={"If-None-Match": etag}).status_code == 304
+        login = {"username": test_user["email"], "password": test_user["password"]}
+        assert client.post("/login", data=login).status_code == 200
+        assert client.get("/posts/", headers=headers).status_code == 200
+
+    hot_requests(batch_size=1)
+    # A different batch size still reuses the compiled batch insert
+    with QueryCounter() as counter:
+        hot_requests(batch_size=2)
+    assert counter.compiled == []
+    assert counter.cache_hit_ratio == 1.0
@@ -0,0 +1,31 @@
+from app import metrics
+
+
+def _sample(text: str, prefix: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"{prefix} not found")
+
+
+def test_metrics_endpoint(client, test_user, test_posts):
+    route_count = 'http_requests_total{method="GET",route="/posts/{id}",status="200"}'
+    before = client.get("/metrics").text
+    start = _sample(before, route_count) if route_count in before else 0
+
+    client.get(f"/posts/{test_posts[0].id}")
+    client.get(f"/posts/{test_posts[1].id}")
+    client.get("/no/such/route")
+    metrics.pool_sync.next_sync = 0
+
+    res = client.get("/metrics")
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("text/plain")
+    text = res.text
+    assert _sample(text, route_count) == start + 2
+    assert 'http_requests_total{method="GET",route="unmatched",status="404"}' in text
+    assert 'http_request_duration_seconds_bucket{le="0.005",method="GET",route="/posts/{id}"}' in text
+    assert 'http_response_size_bytes_count{method="GET",route="/posts/{id}"}' in text
+    assert 'db_pool_connections{engine="sync",state="checked_out"}' in text
+    # test_user logged in through the hashing pool
+    assert _sample(text, 'password_hash_seconds_count{operation="verify_and_update"}') >= 1
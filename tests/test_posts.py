@@ -1,5 +1,10 @@
+import csv
+import io
+import json
 from typing import List
-from app import schemas
+from app import models, schemas
+from app.config import settings
+from app.database import QueryCounter
 import pytest
 
 
@@ -42,6 +47,136 @@ def test_get_all_posts(client, test_user):
     assert "First Post" in titles
     assert "Second Post" in titles
 
+def test_get_all_posts_query_count_is_constant(client, test_user, test_posts):
+    headers = {"Authorization": f"Bearer {test_user['token']}"}
+    # warm the user cache so both pages find the current user and owners there
+    client.get("/posts/", headers=headers)
+
+    with QueryCounter() as small_page:
+        res = client.get("/posts/?limit=1", headers=headers)
+    assert len(res.json()) == 1
+
+    with QueryCounter() as full_page:
+        res = client.get("/posts/?limit=100", headers=headers)
+    assert len(res.json()) == len(test_posts)
+
+    # posts and vote counts come back in a single statement, owners from the cache
+    assert small_page.count == full_page.count == 1
+
+
+def test_get_posts_cursor_pagination(client, test_user, test_posts):
+    headers = {"Authorization": f"Bearer {test_user['token']}"}
+
+    first = client.get("/posts/?limit=2", headers=headers)
+    assert first.status_code == 200
+    assert len(first.json()) == 2
+    cursor = first.headers["X-Next-Cursor"]
+
+    second = client.get("/posts/", params={"limit": 2, "cursor": cursor}, headers=headers)
+    assert second.status_code == 200
+    assert "X-Next-Cursor" not in second.headers
+
+    seen = [p["Post"]["id"] for p in first.json() + second.json()]
+    assert sorted(seen) == sorted(post.id for post in test_posts)
+
+
+def test_get_posts_legacy_skip(client, test_user, test_posts):
+    headers = {"Authorization": f"Bearer {test_user['token']}"}
+    everything = client.get("/posts/?limit=10", headers=headers).json()
+
+    res = client.get("/posts/?limit=1&skip=1", headers=headers)
+    assert res.status_code == 200
+    assert res.json() == everything[1:2]
+
+
+def test_get_posts_invalid_cursor(client, test_user):
+    headers = {"Authorization": f"Bearer {test_user['token']}"}
+    res = client.get("/posts/?cursor=not-a-cursor", headers=headers)
+    assert res.status_code == 400
+
+
+@pytest.mark.parametrize("params, titles", [
+    ({"search": "Second"}, ["Second Post"]),
+    ({"search": "third", "mode": "fts"}, ["Third Post"]),
+    ({"search": "content post", "mode": "fts"}, ["Third Post", "Second Post", "First Post"]),
+    ({"search": "nothing like this", "mode": "fts"}, []),
+])
+def test_search_posts(client, test_user, test_posts, params, titles):
+    headers = {"Authorization": f"Bearer {test_user['token']}"}
+    res = client.get("/posts/", params=params, headers=headers)
+    assert res.status_code == 200
+    assert [p["Post"]["title"] for p in res.json()] == titles
+
+
+def test_search_posts_fts_rejects_cursor(client, test_user):
+    headers = {"Authorization": f"Bearer {test_user['token']}"}
+    res = client.get("/posts/", params={"search": "x", "mode": "fts", "cursor": "abc"}, headers=headers)
+    assert res.status_code == 400
+
+
+def test_get_one_post_owner_from_cache(client, session, test_posts):
+    first, second = test_posts[0], test_posts[1]
+    assert first.owner_id == second.owner_id
+    # the test session is shared across requests; make posts load from the database again
+    session.expire_all()
+
+    with QueryCounter() as cold:
+        res = client.get(f"/posts/{first.id}")
+    assert res.status_code == 200
+    assert res.json()["Post"]["owner"]["id"] == first.owner_id
+    assert cold.count == 2
+
+    with QueryCounter() as warm:
+        res = client.get(f"/posts/{second.id}")
+    assert res.json()["Post"]["owner"]["id"] == second.owner_id
+    assert warm.count == 1
+
+    stats = client.get("/stats/cache").json()["users"]
+    assert stats["hits"] >= 1 and stats["misses"] >= 1
+
+
+def test_get_one_post_etag(client, test_user, test_posts):
+    post_id = test_posts[0].id
+    res = client.get(f"/posts/{post_id}")
+    etag = res.headers["ETag"]
+    assert res.headers["Last-Modified"]
+
+    res = client.get(f"/posts/{post_id}", headers={"If-None-Match": etag})
+    assert res.status_code == 304
+    assert res.content == b""
+    assert res.headers["ETag"] == etag
+
+    # weak validators from intermediaries still match
+    res = client.get(f"/posts/{post_id}", headers={"If-None-Match": f"W/{etag}"})
+    assert res.status_code == 304
+
+    client.post("/vote/", json={"post_id": post_id, "dir": 1},
+                headers={"Authorization": f"Bearer {test_user['token']}"})
+    res = client.get(f"/posts/{post_id}", headers={"If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.headers["ETag"] != etag
+    assert res.json()["votes"] == 1
+
+
+def test_get_posts_etag(client, test_user, test_posts):
+    headers = {"Authorization": f"Bearer {test_user['token']}"}
+    res = client.get("/posts/", params={"limit": 2}, headers=headers)
+    etag, next_cursor = res.headers["ETag"], res.headers["X-Next-Cursor"]
+
+    res = client.get("/posts/", params={"limit": 2}, headers={**headers, "If-None-Match": etag})
+    assert res.status_code == 304
+    assert res.headers["X-Next-Cursor"] == next_cursor
+
+    # second newest post, owned by test_user
+    post_id = test_posts[1].id
+    res = client.put(f"/posts/{post_id}", json={"title": "Edited", "content": "Edited"},
+               headers=headers)
+    assert res.status_code == 200
+    res = client.get("/posts/", params={"limit": 2}, headers={**headers, "If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.headers["ETag"] != etag
+
+
 def test_get_one_post(client, test_user):
     posts = create_test_posts(client, test_user)
     post_id = posts[0].Post.id
@@ -192,3 +327,99 @@ def test_update_other_user_post(client, test_user, test_user2):
 
     # Step 4: Assert forbidden
     assert update_res.status_code == 403
+
+
+def test_post_json_matches_schema_dump(client, test_posts, session):
+    post = test_posts[0]
+    res = client.get(f"/posts/{post.id}")
+    owner = session.get(models.User, post.owner_id)
+    expected = schemas.PostOut(
+        Post=schemas.PostSchema.model_validate({**post.__dict__, "owner": schemas.UserOut.model_validate(owner)}),
+        votes=0,
+    )
+    assert res.json() == json.loads(expected.model_dump_json())
+
+
+def test_get_posts_sparse_fields(client, test_user, test_posts, session):
+    headers = {"Authorization": f"Bearer {test_user['token']}"}
+    session.expire_all()
+    with QueryCounter() as counter:
+        res = client.get("/posts/", params={"fields": "title"}, headers=headers)
+    assert res.status_code == 200
+    assert [set(post["Post"]) for post in res.json()] == [{"id", "title"}] * len(test_posts)
+    assert all("votes" in post for post in res.json())
+    assert not any("posts.content" in statement for statement in counter.statements)
+
+    res = client.get("/posts/", params={"fields": "title", "owner_fields": "email"}, headers=headers)
+    assert set(res.json()[0]["Post"]["owner"]) == {"id", "email"}
+
+    res = client.get(f"/posts/{test_posts[0].id}", params={"fields": "content,published"})
+    assert set(res.json()["Post"]) == {"id", "content", "published"}
+
+
+def test_get_posts_unknown_field(client, test_user):
+    res = client.get("/posts/", params={"fields": "title,password"},
+                     headers={"Authorization": f"Bearer {test_user['token']}"})
+    assert res.status_code == 400
+    assert res.json()["detail"] == "Unknown post field(s): password"
+
+
+def test_export_posts_ndjson(client, test_user, test_posts, monkeypatch):
+    # several fetches from the server-side cursor
+    monkeypatch.setattr(settings, "export_batch_size", 2)
+    headers = {"Authorization": f"Bearer {test_user['token']}"}
+    res = client.get("/posts/export", headers=headers)
+    assert res.status_code == 200
+    assert res.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in res.text.splitlines()]
+    assert [row["id"] for row in rows] == sorted(post.id for post in test_posts)
+    assert rows[0]["content"] == test_posts[0].content
+    assert rows[0]["votes"] == 0
+
+    res = client.get("/posts/export", params={"search": "Third"}, headers=headers)
+    assert [json.loads(line)["title"] for line in res.text.splitlines()] == ["Third Post"]
+
+
+def test_export_posts_csv(client, test_user, test_posts, session):
+    test_posts[1].published = False
+    session.commit()
+    headers = {"Authorization": f"Bearer {test_user['token']}"}
+
+    res = client.get("/posts/export", params={"format": "csv", "published": False}, headers=headers)
+    assert res.headers["content-type"].startswith("text/csv")
+    header, *rows = list(csv.reader(io.StringIO(res.text)))
+    assert header[:3] == ["id", "title", "content"]
+    assert [row[1] for row in rows] == ["Second Post"]
+
+    res = client.get("/posts/", params={"published": False}, headers=headers)
+    assert [post["Post"]["title"] for post in res.json()] == ["Second Post"]
+
+
+def test_export_posts_requires_auth(client):
+    assert client.get("/posts/export").status_code == 401
+
+
+def test_create_posts_bulk(client, test_user):
+    headers = {"Authorization": f"Bearer {test_user['token']}"}
+    batch = [{"title": f"Bulk {i}", "content": f"Body {i}", "published": i % 2 == 0} for i in range(5)]
+
+    with QueryCounter() as counter:
+        res = client.post("/posts/bulk", json=batch, headers=headers)
+    assert res.status_code == 201
+    created = [schemas.PostOut(**post) for post in res.json()]
+    assert [post.Post.title for post in created] == [item["title"] for item in batch]
+    assert [post.Post.published for post in created] == [item["published"] for item in batch]
+    assert all(post.Post.owner.id == test_user["id"] and post.votes == 0 for post in created)
+    assert [post.Post.id for post in created] == sorted(post.Post.id for post in created)
+    # get_current_user's lookup plus one INSERT ... RETURNING
+    assert counter.count == 2
+
+    res = client.get(f"/posts/{created[-1].Post.id}")
+    assert res.json()["Post"]["title"] == "Bulk 4"
+
+
+def test_create_posts_bulk_limit(client, test_user, monkeypatch):
+    monkeypatch.setattr(settings, "post_bulk_limit", 1)
+    post = {"title": "t", "content": "c"}
+    res = client.post("/posts/bulk", json=[post, post], headers={"Authorization": f"Bearer {test_user['token']}"})
+    assert res.status_code == 422
@@ -0,0 +1,42 @@
+import numpy as np
+from sqlalchemy import delete, func, select
+from app import cli, models, seed
+from tests.conftest import engine
+
+
+def test_generate_votes_is_reproducible_and_skewed():
+    def votes(seed_value):
+        return seed.generate_votes(np.random.default_rng(seed_value), users=200, posts=100, votes=2000, zipf=1.5)
+
+    users, posts = votes(7)
+    again_users, again_posts = votes(7)
+    assert np.array_equal(users, again_users) and np.array_equal(posts, again_posts)
+    # unique pairs
+    assert len(set(zip(users.tolist(), posts.tolist()))) == len(users) == 2000
+    counts = np.sort(np.bincount(posts))[::-1]
+    assert counts[0] > 10 * np.median(counts)
+
+
+def test_seed_database(session, client):
+    options = seed.SeedOptions(users=20, posts=50, votes=300, seed=3, password="seeded")
+    result = seed.seed_database(engine, options, log=lambda message: None)
+    assert (result.users, result.posts, result.votes) == (20, 50, 300)
+
+    assert session.scalar(select(func.count()).select_from(models.Vote)) == 300
+    assert session.scalar(select(func.count()).select_from(models.PostRanking)) == 50
+    assert cli.find_vote_drift(session) == []
+
+    res = client.post("/login", data={"username": "user1@example.com", "password": "seeded"})
+    assert res.status_code == 200
+
+
+def test_seed_database_after_delete(session):
+    # emptied, but the id sequences have moved past 1
+    seed.seed_database(engine, seed.SeedOptions(users=3, posts=5, votes=5), log=lambda message: None)
+    session.execute(delete(models.User))
+    session.commit()
+
+    result = seed.seed_database(engine, seed.SeedOptions(users=5, posts=10, votes=20), log=lambda message: None)
+    assert (result.users, result.posts, result.votes) == (5, 10, 20)
+    assert session.scalar(select(func.min(models.User.id))) == 1
+    assert cli.find_vote_drift(session) == []
@@ -0,0 +1,34 @@
+from fastapi.testclient import TestClient
+
+from app import config, models, rankings
+from app.main import create_app
+
+
+def test_create_app_warms_up_in_lifespan(session):
+    app = create_app()
+    with TestClient(app) as client:
+        warmup_ms = client.get("/stats/startup").json()["warmup_ms"]
+        assert client.get("/posts/0").status_code == 404
+    assert set(warmup_ms) == {"database", "hash_pool", "schemas"}
+    assert app.openapi_schema is not None
+
+
+def test_warmup_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(config.settings, "warmup", False)
+    app = create_app()
+    with TestClient(app) as client:
+        assert client.get("/stats/startup").json() == {"warmup_ms": {}}
+    assert app.openapi_schema is None
+
+
+def test_shutdown_refreshes_marked_rankings(session, test_posts, monkeypatch):
+    # no tick of the refresh loop before shutdown
+    monkeypatch.setattr(config.settings, "rankings_refresh_seconds", 3600)
+    monkeypatch.setattr(config.settings, "warmup", False)
+    post_id = test_posts[0].id
+    with TestClient(create_app()):
+        rankings.mark_dirty([post_id])
+        assert session.get(models.PostRanking, post_id) is None
+    session.expire_all()
+    assert session.get(models.PostRanking, post_id) is not None
+    assert post_id not in rankings._dirty
@@ -1,6 +1,11 @@
+import asyncio
+import os
+import signal
+import time
+
 import pytest
 from jose import jwt
-from app import schemas
+from app import schemas, models, utils, metrics, throttle
 from app.config import settings
 
 
@@ -42,3 +47,92 @@ def test_incorrect_login(client, test_user, email, password, status_code):
     res = client.post("/login", data={"username": email, "password": password})
     assert res.status_code == status_code
     assert res.json().get("detail") == "Invalid Credentials"
+
+
+def test_login_rehashes_password_with_new_cost(client, session):
+    # stored with a cheaper cost than the configured bcrypt_rounds
+    user = models.User(email="oldhash@gmail.com", password=utils.pwd_context.hash("password123", rounds=4))
+    session.add(user)
+    session.commit()
+
+    res = client.post("/login", data={"username": "oldhash@gmail.com", "password": "password123"})
+    assert res.status_code == 200
+
+    session.refresh(user)
+    assert user.password.startswith(f"$2b${settings.bcrypt_rounds:02d}$")
+    assert utils.verify("password123", user.password)
+
+
+def test_login_throttled_per_username(client):
+    burst = settings.login_user_burst
+    for _ in range(burst):
+        res = client.post("/login", data={"username": "nobody@gmail.com", "password": "wrong"})
+        assert res.status_code == 403
+
+    throttled = metrics.LOGIN_THROTTLED.labels("username")._value.get()
+    res = client.post("/login", data={"username": "Nobody@gmail.com ", "password": "wrong"})
+    assert res.status_code == 429
+    assert int(res.headers["Retry-After"]) >= 1
+    assert metrics.LOGIN_THROTTLED.labels("username")._value.get() == throttled + 1
+
+
+def test_login_throttled_per_ip(client, monkeypatch):
+    monkeypatch.setitem(throttle.login_throttle.limits, "ip", (2, 1 / 60))
+    for i in range(2):
+        assert client.post("/login", data={"username": f"u{i}@gmail.com", "password": "x"}).status_code == 403
+    res = client.post("/login", data={"username": "u3@gmail.com", "password": "x"})
+    assert res.status_code == 429
+    assert 1 <= int(res.headers["Retry-After"]) <= 60
+
+
+def test_postgres_throttle_backend(session):
+    backend = throttle.PostgresBackend()
+
+    async def attempts():
+        return [await backend.take("ip:10.0.0.1", 2, 1 / 60) for _ in range(3)]
+
+    first, second, third = asyncio.run(attempts())
+    assert first == second == 0
+    assert 55 < third <= 60
+    assert session.get(models.LoginThrottle, "ip:10.0.0.1").tokens < 1
+
+
+def test_hash_queue_full_returns_503(client, monkeypatch):
+    monkeypatch.setattr(settings, "hash_queue_limit", 0)
+    res = client.post("/users/", json={"email": "busy@gmail.com", "password": "password123"})
+    assert res.status_code == 503
+    assert res.headers["Retry-After"] == "1"
+
+
+def test_hash_pool_recovers_from_killed_process():
+    async def hash_after_kill():
+        await utils.hash_async("password123")
+        broken = utils._executor
+        os.kill(next(iter(broken._processes)), signal.SIGKILL)
+        # Wait for the executor to notice, so the next job hits the broken pool
+        deadline = time.monotonic() + 10
+        while not broken._broken and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        return broken, await utils.hash_async("password123"), await utils.hash_async("password123")
+
+    broken, first, second = asyncio.run(hash_after_kill())
+    assert utils._executor is not None and utils._executor is not broken
+    assert utils.verify("password123", first) and utils.verify("password123", second)
+
+
+def test_update_user_invalidates_cached_user(client, test_user):
+    headers = {"Authorization": f"Bearer {test_user['token']}"}
+    client.post("/posts/", json={"title": "t", "content": "c"}, headers=headers)
+    assert client.get("/posts/", headers=headers).json()[0]["Post"]["owner"]["email"] == test_user["email"]
+
+    res = client.put(f"/users/{test_user['id']}", json={"email": "renamed@gmail.com", "password": "password123"})
+    assert res.status_code == 200
+    assert client.get("/posts/", headers=headers).json()[0]["Post"]["owner"]["email"] == "renamed@gmail.com"
+
+
+def test_deleted_user_token_rejected(client, test_user):
+    headers = {"Authorization": f"Bearer {test_user['token']}"}
+    assert client.get("/posts/", headers=headers).status_code == 200
+
+    client.delete(f"/users/{test_user['id']}")
+    assert client.get("/posts/", headers=headers).status_code == 401
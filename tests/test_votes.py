@@ -1,5 +1,7 @@
+import asyncio
 import pytest
-from app import models
+from app import models, cli, config, rankings
+from app.database import QueryCounter, ThreadedSession
 @pytest.fixture()
 def test_votes(client, test_user, test_posts):
     # User votes on the first post
@@ -45,4 +47,134 @@ def test_delete_vote(test_posts, authorized_client, client, test_user):
     res = client.post("/vote/", json=delete_data, headers=headers)
     assert res.status_code == 201
     assert res.json() == {"message": "successfully deleted vote"}
-    
\ No newline at end of file
+    
+
+def test_vote_updates_post_votes_count(test_posts, client, test_user):
+    post_id = test_posts[0].id
+    headers = {"Authorization": f"Bearer {test_user['token']}"}
+
+    client.post("/vote/", json={"post_id": post_id, "dir": 1}, headers=headers)
+    assert client.get(f"/posts/{post_id}").json()["votes"] == 1
+
+    client.post("/vote/", json={"post_id": post_id, "dir": 0}, headers=headers)
+    assert client.get(f"/posts/{post_id}").json()["votes"] == 0
+
+
+def test_get_posts_sorted_by_votes(test_votes, client, test_user):
+    headers = {"Authorization": f"Bearer {test_user['token']}"}
+    res = client.get("/posts/?sort=votes&limit=1", headers=headers)
+    assert res.status_code == 200
+    assert res.json()[0]["Post"]["id"] == test_votes[0].id
+    assert res.json()[0]["votes"] == 1
+
+    rest = client.get("/posts/", params={"sort": "votes", "cursor": res.headers["X-Next-Cursor"]}, headers=headers)
+    assert test_votes[0].id not in [p["Post"]["id"] for p in rest.json()]
+    assert len(rest.json()) == len(test_votes) - 1
+
+
+def test_reconcile_votes(test_votes, session):
+    post = session.get(models.Post, test_votes[1].id)
+    post.votes_count = 7
+    session.commit()
+
+    drift = cli.find_vote_drift(session)
+    assert [(row.id, row.votes_count, row.actual) for row in drift] == [(post.id, 7, 0)]
+
+    cli.reconcile_votes(session, fix=True)
+    assert cli.find_vote_drift(session) == []
+
+
+def test_delete_user_updates_votes_count(test_posts, client, test_user):
+    other_users_post = test_posts[2].id
+    headers = {"Authorization": f"Bearer {test_user['token']}"}
+    client.post("/vote/", json={"post_id": other_users_post, "dir": 1}, headers=headers)
+    assert client.get(f"/posts/{other_users_post}").json()["votes"] == 1
+
+    client.delete(f"/users/{test_user['id']}")
+    assert client.get(f"/posts/{other_users_post}").json()["votes"] == 0
+
+
+def test_vote_batch(test_votes, client, test_user):
+    headers = {"Authorization": f"Bearer {test_user['token']}"}
+    first, second, third = (post.id for post in test_votes)
+    batch = [
+        {"post_id": first, "dir": 1},
+        {"post_id": second, "dir": 1},
+        {"post_id": third, "dir": 1},
+        {"post_id": third, "dir": 0},
+        {"post_id": 9999, "dir": 1},
+        {"post_id": second, "dir": 1},
+    ]
+    res = client.post("/vote/batch", json=batch, headers=headers)
+    assert res.status_code == 200
+    assert [item["status"] for item in res.json()] == [
+        "already_voted", "superseded", "superseded", "vote_not_found", "post_not_found", "added",
+    ]
+    assert client.get(f"/posts/{first}").json()["votes"] == 1
+    assert client.get(f"/posts/{second}").json()["votes"] == 1
+    assert client.get(f"/posts/{third}").json()["votes"] == 0
+
+    res = client.post("/vote/batch", json=[{"post_id": first, "dir": 0}], headers=headers)
+    assert res.json() == [{"post_id": first, "dir": 0, "status": "removed"}]
+    assert client.get(f"/posts/{first}").json()["votes"] == 0
+
+
+def test_vote_batch_limit(client, test_user, monkeypatch):
+    monkeypatch.setattr(config.settings, "vote_batch_limit", 1)
+    headers = {"Authorization": f"Bearer {test_user['token']}"}
+    res = client.post("/vote/batch", json=[{"post_id": 1, "dir": 1}] * 2, headers=headers)
+    assert res.status_code == 422
+
+
+def test_vote_is_one_statement(test_posts, client, test_user):
+    headers = {"Authorization": f"Bearer {test_user['token']}"}
+    post_id = test_posts[0].id
+    client.get(f"/posts/{post_id}")  # warm the user cache for get_current_user
+
+    with QueryCounter() as counter:
+        res = client.post("/vote/", json={"post_id": post_id, "dir": 1}, headers=headers)
+    assert res.status_code == 201
+    # COMMIT is not a cursor execute, so only the insert-and-count statement shows
+    assert counter.count == 1
+
+
+@pytest.mark.parametrize("dir, detail", [
+    (1, "Post with id 9999 does not exist"),
+    (0, "Post with id 9999 does not exist"),
+])
+def test_vote_on_missing_post(test_posts, client, test_user, dir, detail):
+    res = client.post("/vote/", json={"post_id": 9999, "dir": dir},
+                      headers={"Authorization": f"Bearer {test_user['token']}"})
+    assert res.status_code == 404
+    assert res.json()["detail"] == detail
+
+
+def test_delete_missing_vote(test_posts, client, test_user):
+    res = client.post("/vote/", json={"post_id": test_posts[0].id, "dir": 0},
+                      headers={"Authorization": f"Bearer {test_user['token']}"})
+    assert res.status_code == 404
+    assert res.json()["detail"] == "Vote does not exist"
+
+
+def test_trending_posts(test_posts, client, test_user, test_user2, session):
+    voted = test_posts[0].id
+    for user in (test_user, test_user2):
+        client.post("/vote/", json={"post_id": voted, "dir": 1},
+                    headers={"Authorization": f"Bearer {user['token']}"})
+    assert voted in rankings._dirty
+    session.execute(rankings.refresh_statement([post.id for post in test_posts]))
+    session.commit()
+
+    headers = {"Authorization": f"Bearer {test_user['token']}"}
+    res = client.get("/posts/trending", params={"limit": 2}, headers=headers)
+    assert res.status_code == 200
+    ids = [post["Post"]["id"] for post in res.json()]
+    assert ids[0] == voted
+
+    rest = client.get("/posts/", params={"sort": "top", "cursor": res.headers["X-Next-Cursor"]}, headers=headers)
+    assert len(ids) + len(rest.json()) == len(test_posts)
+
+    # the loop only rescores what votes touched
+    client.post("/vote/", json={"post_id": voted, "dir": 0}, headers=headers)
+    assert asyncio.run(rankings.refresh_dirty(ThreadedSession(session))) >= 1
+    assert rankings._dirty == set()